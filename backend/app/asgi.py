@@ -0,0 +1,58 @@
+from asgiref.typing import ASGIApplication, ASGIReceiveCallable, ASGISendCallable, Scope
+
+from . import config
+from . import game
+from . import static
+from . import websocket
+
+static_files = static.StaticFiles(
+    config.STATIC_DIR, prefix="/app", memory_limit=config.STATIC_MEMORY_LIMIT
+)
+_wsgi_app: ASGIApplication | None = None
+
+
+async def application(
+    scope: Scope, receive: ASGIReceiveCallable, send: ASGISendCallable
+) -> None:
+    if scope["type"] == "websocket":
+        if scope["path"] != "/play":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        await play(websocket.WebSocket(scope, receive, send))
+    elif scope["type"] == "http":
+        if static_files.matches(scope["path"]):
+            await static_files(scope, receive, send)
+        else:
+            await wsgi_app()(scope, receive, send)
+
+
+def wsgi_app() -> ASGIApplication:
+    # Flask is imported on first use, so it doesn't delay startup.
+    global _wsgi_app
+    if _wsgi_app is None:
+        from asgiref.wsgi import WsgiToAsgi
+
+        from . import web
+
+        _wsgi_app = WsgiToAsgi(web.app)
+    return _wsgi_app
+
+
+def warm_up() -> None:
+    """Imports what was left out of startup. Meant to run in a thread once
+    the server accepts connections."""
+    wsgi_app()
+    static_files.index()
+    if game.transcription_client.backend.name == "deepgram":
+        import aiohttp  # noqa: F401
+
+
+# WebSocket endpoint
+async def play(ws: websocket.WebSocket) -> None:
+    await ws.accept(subprotocols=(game.COMPACT_PROTOCOL,))
+    try:
+        await game.play(ws)
+    except websocket.ConnectionClosed:
+        pass
+    finally:
+        await ws.close()
@@ -0,0 +1,322 @@
+import abc
+import array
+import math
+import operator
+import struct
+import sys
+
+WAV_MIMETYPES = {"audio/wav", "audio/wave", "audio/x-wav", "audio/vnd.wave"}
+OGG_MIMETYPES = {"audio/ogg", "audio/opus"}
+
+# Length of the analysis window for PCM audio.
+WINDOW = 0.02
+
+
+def is_wav(mimetype: str | None) -> bool:
+    return _base_type(mimetype) in WAV_MIMETYPES
+
+
+def _base_type(mimetype: str | None) -> str:
+    return (mimetype or "").split(";")[0].strip().lower()
+
+
+def parse_wav_header(header: bytes | bytearray) -> tuple[int, tuple] | None:
+    """Finds where the samples start in a WAV file.
+
+    Returns the offset of the data and the fields of the fmt chunk, or None if
+    `header` doesn't hold the whole header yet. Raises ValueError if it isn't
+    a WAV file.
+    """
+    if len(header) < 12:
+        return None
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(header):
+        chunk_id = bytes(header[offset : offset + 4])
+        (size,) = struct.unpack_from("<I", header, offset + 4)
+        if chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data before fmt chunk")
+            return offset + 8, fmt
+        if offset + 8 + size > len(header):
+            return None
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", header, offset + 8)
+        offset += 8 + size + size % 2
+    return None
+
+
+def set_wav_size(header: bytearray, data_size: int) -> None:
+    # Points the RIFF and data chunk sizes of a header at `data_size` bytes of
+    # samples.
+    struct.pack_into("<I", header, 4, len(header) + data_size - 8)
+    struct.pack_into("<I", header, len(header) - 4, data_size)
+
+
+class AudioBuffer:
+    """Growable audio buffer.
+
+    Storage is allocated up front for the expected size of the recording and
+    only grows (by doubling, up to `limit`) when a player sends more. The
+    caller stops before `limit` is exceeded, see AUDIO_MAX_BYTES. `view`
+    hands out the received audio without copying it.
+    """
+
+    def __init__(self, *, capacity: int, limit: int) -> None:
+        self.limit = limit
+        self._data = bytearray(min(capacity, limit))
+        self._length = 0
+
+    @classmethod
+    def for_duration(cls, seconds: float, *, bitrate: int, limit: int) -> "AudioBuffer":
+        return cls(capacity=int(seconds * bitrate / 8), limit=limit)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def extend(self, data: bytes) -> None:
+        end = self._length + len(data)
+        if end > len(self._data):
+            size = min(self.limit, max(end, 2 * len(self._data)))
+            self._data.extend(bytes(size - len(self._data)))
+        self._data[self._length : end] = data
+        self._length = end
+
+    def view(self) -> memoryview:
+        return memoryview(self._data)[: self._length]
+
+
+class VoiceActivityDetector(abc.ABC):
+    """Finds where speech starts and stops while frames are still arriving.
+
+    `feed` is called with every frame in the receive loop and does a small
+    fixed amount of work per frame. `trailing_silence` is the number of seconds
+    since speech was last heard (0 until the player starts talking), and `trim`
+    cuts silence from the finished recording.
+    """
+
+    def __init__(self, *, padding: float) -> None:
+        self.padding = padding
+        self.trailing_silence = 0.0
+        self.speech_started = False
+        self.supported = True
+
+    @staticmethod
+    def for_mimetype(
+        mimetype: str | None, *, threshold: int, padding: float
+    ) -> "VoiceActivityDetector | None":
+        if is_wav(mimetype):
+            return WavDetector(threshold=threshold, padding=padding)
+        if _base_type(mimetype) in OGG_MIMETYPES:
+            return OggOpusDetector(padding=padding)
+        return None
+
+    @abc.abstractmethod
+    def feed(self, data: bytes) -> None:
+        pass
+
+    @abc.abstractmethod
+    def trim(self, buffer: memoryview) -> memoryview:
+        pass
+
+    def _update(self, voiced: bool, duration: float) -> None:
+        if voiced:
+            self.speech_started = True
+            self.trailing_silence = 0.0
+        elif self.speech_started:
+            self.trailing_silence += duration
+
+
+class WavDetector(VoiceActivityDetector):
+    """Energy based detection for 16-bit PCM WAV."""
+
+    def __init__(self, *, threshold: int, padding: float) -> None:
+        super().__init__(padding=padding)
+        self.threshold = threshold
+
+        self._header = bytearray()
+        self._data_offset: int | None = None
+        self._window = 0
+        self._byte_rate = 0
+        self._block_align = 0
+        self._carry = bytearray()
+        self._position = 0
+        self._speech_start: int | None = None
+        self._speech_end = 0
+
+    def feed(self, data: bytes) -> None:
+        if not self.supported:
+            return
+        if self._data_offset is None:
+            self._header.extend(data)
+            data = self._parse_header()
+            if not data:
+                return
+
+        self._carry.extend(data)
+        samples = array.array("h")
+        end = len(self._carry) - len(self._carry) % self._window
+        for start in range(0, end, self._window):
+            samples.frombytes(self._carry[start : start + self._window])
+            if sys.byteorder == "big":
+                samples.byteswap()
+            rms = math.sqrt(sum(map(operator.mul, samples, samples)) / len(samples))
+            voiced = rms >= self.threshold
+            if voiced:
+                if self._speech_start is None:
+                    self._speech_start = self._position
+                self._speech_end = self._position + self._window
+            self._update(voiced, WINDOW)
+            self._position += self._window
+            del samples[:]
+        del self._carry[:end]
+
+    def trim(self, buffer: memoryview) -> memoryview:
+        if not self.supported or self._data_offset is None:
+            return buffer
+        if self._speech_start is None:
+            # Nothing sounded like speech, let transcription have the last word.
+            return buffer
+
+        pad = int(self.padding * self._byte_rate)
+        pad -= pad % self._block_align
+        data_size = len(buffer) - self._data_offset
+        start = max(0, self._speech_start - pad)
+        end = min(data_size, self._speech_end + pad)
+
+        # Move the header up to sit right before the kept audio, over the
+        # silence being dropped, so no audio has to be copied.
+        header = bytearray(buffer[: self._data_offset])
+        set_wav_size(header, end - start)
+        buffer[start : start + self._data_offset] = header
+        return buffer[start : self._data_offset + end]
+
+    def _parse_header(self) -> bytes:
+        # Returns any PCM data that followed the header, or b"" if more of the
+        # header is needed.
+        try:
+            parsed = parse_wav_header(self._header)
+        except ValueError:
+            self.supported = False
+            return b""
+        if parsed is None:
+            return b""
+
+        self._data_offset, fmt = parsed
+        tag, channels, rate, byte_rate, block_align, bits = fmt
+        if tag not in (1, 0xFFFE) or bits != 16:
+            self.supported = False
+            return b""
+        self._byte_rate = byte_rate
+        self._block_align = block_align
+        self._window = max(1, int(rate * WINDOW)) * block_align
+
+        data = bytes(self._header[self._data_offset :])
+        del self._header[self._data_offset :]
+        return data
+
+
+class OggOpusDetector(VoiceActivityDetector):
+    """Detection for Ogg/Opus from the size of the encoded packets.
+
+    With variable bitrate, Opus spends fewer bytes on silence and background
+    noise than on speech, so packets well above the noise floor are treated as
+    speech. No decoding is needed.
+
+    Pages can't be dropped from the middle of an Ogg stream, so only trailing
+    silence is trimmed.
+    """
+
+    # A packet this much bigger than the noise floor counts as speech.
+    RATIO = 1.4
+    # How quickly the noise floor follows louder packets.
+    FLOOR_RISE = 0.01
+    # Below this size every packet is silence, whatever the noise floor.
+    MIN_SPEECH_BYTES = 20
+
+    def __init__(self, *, padding: float) -> None:
+        super().__init__(padding=padding)
+
+        self._pending = bytearray()
+        self._offset = 0
+        self._granule = 0
+        self._floor: float | None = None
+        self._speech_granule: float | None = None
+        self._cut: int | None = None
+
+    def feed(self, data: bytes) -> None:
+        if not self.supported:
+            return
+        self._pending.extend(data)
+        consumed = 0
+        while True:
+            page = self._next_page(consumed)
+            if page is None:
+                break
+            granule, packets, length = page
+            consumed += length
+            self._offset += length
+            self._page(granule, packets)
+        del self._pending[:consumed]
+
+    def trim(self, buffer: memoryview) -> memoryview:
+        if self._cut is None or self._cut >= len(buffer):
+            return buffer
+        return buffer[: self._cut]
+
+    def _next_page(self, start: int) -> tuple[int, list[int], int] | None:
+        pending = self._pending
+        if len(pending) < start + 27:
+            return None
+        if pending[start : start + 4] != b"OggS":
+            self.supported = False
+            return None
+        (granule,) = struct.unpack_from("<q", pending, start + 6)
+        segments = pending[start + 26]
+        if len(pending) < start + 27 + segments:
+            return None
+        lacing = pending[start + 27 : start + 27 + segments]
+        length = 27 + segments + sum(lacing)
+        if len(pending) < start + length:
+            return None
+
+        packets = []
+        size = 0
+        for value in lacing:
+            size += value
+            if value < 255:
+                packets.append(size)
+                size = 0
+        return granule, packets, length
+
+    def _page(self, granule: int, packets: list[int]) -> None:
+        if granule <= 0 or not packets:
+            # OpusHead and OpusTags pages, or pages without a finished packet.
+            return
+
+        step = max(0, granule - self._granule) / len(packets)
+        for i, size in enumerate(packets):
+            if self._floor is None:
+                self._floor = size
+            voiced = size >= self.MIN_SPEECH_BYTES and size >= self._floor * self.RATIO
+            # The floor drops straight to quieter packets but only creeps up, so
+            # it tracks background noise rather than speech.
+            if size < self._floor:
+                self._floor = size
+            else:
+                self._floor += (size - self._floor) * self.FLOOR_RISE
+            self._update(voiced, step / 48000)
+            if voiced:
+                self._speech_granule = self._granule + (i + 1) * step
+                self._cut = None
+        self._granule = granule
+
+        if (
+            self._speech_granule is not None
+            and self._cut is None
+            and granule - self._speech_granule >= self.padding * 48000
+        ):
+            self._cut = self._offset
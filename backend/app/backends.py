@@ -0,0 +1,316 @@
+import abc
+import asyncio
+import concurrent.futures
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import pathlib
+import re
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, AsyncContextManager
+
+from . import rules
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionError(Exception):
+    def __init__(self, message: str, *, transient: bool = False) -> None:
+        super().__init__(message)
+        # Whether trying again might work.
+        self.transient = transient
+
+
+class Backend(abc.ABC):
+    """Speech recognizer behind a TranscriptionClient.
+
+    `transcribe` takes a source (`buffer` and `mimetype`) and Deepgram's
+    transcription options, and returns a response shaped like Deepgram's
+    prerecorded responses, since that is what cards validate. Only backends
+    with `streaming` set can stream audio while the player talks.
+    """
+
+    name: str
+    streaming = False
+
+    @abc.abstractmethod
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        pass
+
+    def connect(self, options: dict) -> AsyncContextManager[Any]:
+        raise NotImplementedError(f"The {self.name} backend can't stream")
+
+    async def close(self) -> None:
+        pass
+
+
+class DeepgramBackend(Backend):
+    """Deepgram's API.
+
+    Requests reuse one pooled keep-alive HTTP session, so cards don't pay for
+    a new TLS handshake each time. The session is bound to the event loop of
+    the first request, which is the server's loop. aiohttp is only imported
+    then, which keeps it out of startup.
+    """
+
+    name = "deepgram"
+    streaming = True
+
+    def __init__(self, *, api_key: str, api_url: str, pool_size: int, timeout: int):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._session: "aiohttp.ClientSession | None" = None
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        import aiohttp
+
+        headers = self._headers()
+        if source.get("mimetype"):
+            headers["Content-Type"] = source["mimetype"]
+
+        try:
+            async with self._get_session().post(
+                f"{self.api_url}/listen",
+                params=query_params(options),
+                data=source["buffer"],
+                headers=headers,
+            ) as resp:
+                # Server errors and rate limiting are worth retrying, other
+                # errors will just happen again.
+                transient = resp.status >= 500 or resp.status == 429
+                try:
+                    body = await resp.json(content_type=None)
+                except ValueError:
+                    body = None
+                if resp.status >= 400 or not body or body.get("error"):
+                    raise TranscriptionError(
+                        f"DG: {resp.status} {body}", transient=transient
+                    )
+                return body
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TranscriptionError(f"DG: {e!r}", transient=True) from e
+
+    def connect(
+        self, options: dict
+    ) -> "AsyncContextManager[aiohttp.ClientWebSocketResponse]":
+        ws_url = "ws" + self.api_url.removeprefix("http")
+        return self._get_session().ws_connect(
+            f"{ws_url}/listen",
+            params=query_params(options),
+            headers=self._headers(),
+            heartbeat=5,
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Token {self.api_key}"}
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None:
+            if not self.api_key:
+                raise TranscriptionError(
+                    "Configuration option DEEPGRAM_API_KEY is required"
+                )
+
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+
+class LocalBackend(Backend):
+    """Transcribes on this machine's CPU with faster-whisper
+    (`pip install faster-whisper`).
+
+    Whisper only transcribes: responses have no topics, sentiment, entities
+    or speakers, so cards that need those can't be won. At most `workers`
+    transcriptions run at once, each using all cores. faster-whisper and the
+    model are loaded on first use.
+    """
+
+    name = "local"
+
+    def __init__(self, *, model: str, workers: int) -> None:
+        if importlib.util.find_spec("faster_whisper") is None:
+            raise RuntimeError(
+                "The local transcription backend needs faster-whisper, "
+                "install it with pip install faster-whisper"
+            )
+
+        self.model = model
+        self._model: Any = None
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self._warned: set[str] = set()
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        for option in rules.FEATURES:
+            if options.get(option) and option not in self._warned:
+                logger.warning("The local backend ignores %s", option)
+                self._warned.add(option)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, self._transcribe, bytes(source["buffer"]), options
+            )
+        except Exception as e:
+            raise TranscriptionError(f"Local: {e!r}") from e
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _transcribe(self, buffer: bytes, options: dict) -> dict:
+        language = options.get("language")
+        segments, info = self._load().transcribe(
+            io.BytesIO(buffer),
+            language=language.split("-")[0] if language else None,
+            word_timestamps=True,
+        )
+
+        texts = []
+        words = []
+        for segment in segments:
+            texts.append(segment.text.strip())
+            for word in segment.words:
+                punctuated = word.word.strip()
+                plain = _strip_punctuation(punctuated).lower()
+                if plain:
+                    words.append(
+                        {
+                            "word": plain,
+                            "punctuated_word": punctuated,
+                            "start": word.start,
+                            "end": word.end,
+                            "confidence": word.probability,
+                        }
+                    )
+
+        transcript = " ".join(filter(None, texts))
+        if not options.get("punctuate"):
+            transcript = _strip_punctuation(transcript)
+        confidence = sum(w["confidence"] for w in words) / len(words) if words else 0
+        return {
+            "metadata": {
+                "request_id": uuid.uuid4().hex,
+                "model": self.model,
+                "duration": info.duration,
+            },
+            "results": {
+                "channels": [
+                    {
+                        "alternatives": [
+                            {
+                                "transcript": transcript,
+                                "confidence": confidence,
+                                "words": words,
+                            }
+                        ]
+                    }
+                ]
+            },
+        }
+
+    def _load(self) -> Any:
+        with self._lock:
+            if self._model is None:
+                import faster_whisper
+
+                logger.info("Loading whisper model %s", self.model)
+                self._model = faster_whisper.WhisperModel(
+                    self.model, device="cpu", compute_type="int8"
+                )
+            return self._model
+
+
+class FixtureBackend(Backend):
+    """Canned responses, for tests and benchmarks that shouldn't depend on a
+    speech recognizer.
+
+    Audio that matches a clip in `directory` gets the response saved next to
+    it (e.g. CryptoCard.ogg and CryptoCard.json, as for fake_deepgram.py),
+    any other audio gets `transcript`.
+    """
+
+    name = "fixture"
+
+    def __init__(self, *, transcript: str, directory: str | None = None) -> None:
+        self.transcript = transcript
+        self._fixtures = load_fixtures(directory) if directory else {}
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        fixture = self._fixtures.get(hashlib.sha256(source["buffer"]).hexdigest())
+        if fixture is not None:
+            return fixture
+        words = [
+            {
+                "word": _strip_punctuation(word).lower(),
+                "start": i * 0.3,
+                "end": i * 0.3 + 0.25,
+                "confidence": 1.0,
+            }
+            for i, word in enumerate(self.transcript.split())
+        ]
+        return {
+            "metadata": {"request_id": "fixture"},
+            "results": {
+                "channels": [
+                    {
+                        "alternatives": [
+                            {
+                                "transcript": self.transcript,
+                                "confidence": 1.0,
+                                "words": words,
+                            }
+                        ]
+                    }
+                ]
+            },
+        }
+
+
+def load_fixtures(directory: str) -> dict[str, dict]:
+    # A fixture is a clip plus a canned response with the same name, e.g.
+    # CryptoCard.ogg and CryptoCard.json. Responses are keyed by the SHA-256
+    # of the clip.
+    fixtures = {}
+    for response in pathlib.Path(directory).glob("*.json"):
+        for clip in response.parent.glob(f"{response.stem}.*"):
+            if clip != response:
+                digest = hashlib.sha256(clip.read_bytes()).hexdigest()
+                fixtures[digest] = json.loads(response.read_text())
+    return fixtures
+
+
+def query_params(options: dict) -> list[tuple[str, str]]:
+    # Same encoding as the Deepgram SDK: booleans are lowercased, lists are
+    # repeated and empty values are dropped.
+    params = []
+    for key, value in options.items():
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or item == "":
+                continue
+            if isinstance(item, bool):
+                item = str(item).lower()
+            params.append((key, str(item)))
+    return params
+
+
+def _strip_punctuation(text: str) -> str:
+    return re.sub(r"[^\w\s']", "", text).strip()
@@ -0,0 +1,121 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionCache:
+    """Transcription results keyed by audio content and request options.
+
+    Entries live in an in-memory LRU bounded by `size` and expire after `ttl`
+    seconds. With a `directory`, entries are also written to disk as JSON, so
+    they survive restarts and are shared by workers on the same host. Expired
+    files are swept from the directory at most every `SWEEP_INTERVAL` seconds.
+    """
+
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, *, size: int, ttl: int, directory: str | None = None) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.directory = directory
+
+        self._entries: collections.OrderedDict[str, tuple[float, dict]] = (
+            collections.OrderedDict()
+        )
+        self._swept = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(
+        audio: bytes | bytearray | memoryview, params: list[tuple[str, str]]
+    ) -> str:
+        digest = hashlib.sha256(audio)
+        digest.update(json.dumps(sorted(params)).encode())
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> dict | None:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            metrics.CACHE_LOOKUPS.labels("hit").inc()
+            return entry[1]
+
+        response = None
+        if self.directory:
+            response = await asyncio.to_thread(self._read, key, now)
+        if response is None:
+            metrics.CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        metrics.CACHE_LOOKUPS.labels("hit").inc()
+        self._remember(key, response, now)
+        return response
+
+    async def put(self, key: str, response: dict) -> None:
+        now = time.time()
+        self._remember(key, response, now)
+        if self.directory:
+            await asyncio.to_thread(self._write, key, response)
+            if now - self._swept >= self.SWEEP_INTERVAL:
+                self._swept = now
+                await asyncio.to_thread(self._sweep, now)
+
+    def _remember(self, key: str, response: dict, now: float) -> None:
+        if self.size <= 0:
+            return
+        self._entries[key] = (now + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key: str, now: float) -> dict | None:
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.unlink(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sweep(self, now: float) -> None:
+        # Most audio is never sent twice, so entries are rarely read again
+        # and would otherwise pile up. Left-over temporary files go too.
+        removed = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.stat().st_mtime + self.ttl <= now:
+                            os.unlink(entry.path)
+                            removed += 1
+                    except OSError:
+                        pass
+        except OSError:
+            logger.warning("Could not sweep %s", self.directory, exc_info=True)
+        if removed:
+            logger.info("Removed %s expired cache entries", removed)
+
+    def _write(self, key: str, response: dict) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(response, f)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Could not write cache entry %s", path, exc_info=True)
@@ -16,6 +16,18 @@ def _get_bool(name: str, *, default: bool | None = None) -> bool:
     raise ValueError(f"Configuration option {name} is required")
 
 
+def _get_float(name: str, *, default: float | None = None) -> float:
+    value = os.getenv(name)
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Configuration option {name} must be a number")
+    if default is not None:
+        return default
+    raise ValueError(f"Configuration option {name} is required")
+
+
 def _get_int(name: str, *, default: int | None = None) -> int:
     value = os.getenv(name)
     if value is not None:
@@ -28,6 +40,23 @@ def _get_int(name: str, *, default: int | None = None) -> int:
     raise ValueError(f"Configuration option {name} is required")
 
 
+def _get_mapping(name: str, *, default: dict | None = None) -> dict[str, str]:
+    value = os.getenv(name)
+    if value is not None:
+        mapping = {}
+        for item in filter(None, (item.strip() for item in value.split(","))):
+            key, sep, item_value = item.partition("=")
+            if not sep:
+                raise ValueError(
+                    f"Configuration option {name} must be a list of key=value pairs"
+                )
+            mapping[key.strip()] = item_value.strip()
+        return mapping
+    if default is not None:
+        return default
+    raise ValueError(f"Configuration option {name} is required")
+
+
 def _get_string(name: str, *, default: str | None = None) -> str:
     value = os.getenv(name)
     if value is not None:
@@ -38,5 +67,86 @@ def _get_string(name: str, *, default: str | None = None) -> str:
 
 
 APP_DEBUG = _get_bool("APP_DEBUG", default=False)
+APP_HOST = _get_string("APP_HOST", default="0.0.0.0")
 APP_PORT = _get_int("APP_PORT", default=8080)
-DEEPGRAM_API_KEY = _get_string("DEEPGRAM_API_KEY")
+APP_WORKERS = _get_int("APP_WORKERS", default=1)
+LOG_LEVEL = _get_string("LOG_LEVEL", default="INFO").upper()
+if LOG_LEVEL not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+    raise ValueError(
+        "Configuration option LOG_LEVEL must be DEBUG, INFO, WARNING or ERROR"
+    )
+LOG_FORMAT = _get_string("LOG_FORMAT", default="text")
+if LOG_FORMAT not in ("text", "json"):
+    raise ValueError("Configuration option LOG_FORMAT must be text or json")
+LOG_SAMPLE_RATE = _get_float("LOG_SAMPLE_RATE", default=1.0)
+WORKER_DRAIN_TIMEOUT = _get_int("WORKER_DRAIN_TIMEOUT", default=60)
+WS_PER_MESSAGE_DEFLATE = _get_bool("WS_PER_MESSAGE_DEFLATE", default=True)
+TRANSCRIPTION_BACKEND = _get_string("TRANSCRIPTION_BACKEND", default="deepgram")
+if TRANSCRIPTION_BACKEND not in ("deepgram", "local", "fixture"):
+    raise ValueError(
+        "Configuration option TRANSCRIPTION_BACKEND must be deepgram, local or fixture"
+    )
+# Only needed by the deepgram backend, which checks for it on first use.
+DEEPGRAM_API_KEY = _get_string("DEEPGRAM_API_KEY", default="")
+DEEPGRAM_API_URL = _get_string(
+    "DEEPGRAM_API_URL", default="https://api.beta.deepgram.com/v1"
+)
+DEEPGRAM_POOL_SIZE = _get_int("DEEPGRAM_POOL_SIZE", default=32)
+DEEPGRAM_TIMEOUT = _get_int("DEEPGRAM_TIMEOUT", default=60)
+LOCAL_ASR_MODEL = _get_string("LOCAL_ASR_MODEL", default="base")
+LOCAL_ASR_WORKERS = _get_int("LOCAL_ASR_WORKERS", default=1)
+FIXTURE_DIR = _get_string("FIXTURE_DIR", default="")
+FIXTURE_TRANSCRIPT = _get_string("FIXTURE_TRANSCRIPT", default="extremely hardcore")
+TRANSCRIPTION_MODES = _get_mapping("TRANSCRIPTION_MODES", default={})
+for _card, _mode in TRANSCRIPTION_MODES.items():
+    if _mode not in ("prerecorded", "streaming", "chunked"):
+        raise ValueError(
+            f"Transcription mode for {_card} must be prerecorded, streaming or chunked"
+        )
+CARD_WEIGHTS = {}
+for _card, _weight in _get_mapping("CARD_WEIGHTS", default={}).items():
+    try:
+        CARD_WEIGHTS[_card] = float(_weight)
+    except ValueError:
+        raise ValueError(f"Weight of {_card} must be a number")
+DECK_SIZE = _get_int("DECK_SIZE", default=0)
+TRANSCRIPTION_CHUNK_SECONDS = _get_int("TRANSCRIPTION_CHUNK_SECONDS", default=8)
+TRANSCRIPTION_CONCURRENCY = _get_int("TRANSCRIPTION_CONCURRENCY", default=32)
+TRANSCRIPTION_QUEUE_SIZE = _get_int("TRANSCRIPTION_QUEUE_SIZE", default=256)
+TRANSCRIPTION_DEADLINE = _get_float("TRANSCRIPTION_DEADLINE", default=15.0)
+TRANSCRIPTION_DEADLINES = {}
+for _card, _deadline in _get_mapping("TRANSCRIPTION_DEADLINES", default={}).items():
+    try:
+        TRANSCRIPTION_DEADLINES[_card] = float(_deadline)
+    except ValueError:
+        raise ValueError(f"Transcription deadline for {_card} must be a number")
+TRANSCRIPTION_RETRIES = _get_int("TRANSCRIPTION_RETRIES", default=2)
+TRANSCRIPTION_RETRY_BACKOFF = _get_int("TRANSCRIPTION_RETRY_BACKOFF", default=200)
+TRANSCRIPTION_HEDGE = _get_bool("TRANSCRIPTION_HEDGE", default=False)
+TRANSCRIPTION_HEDGE_AFTER = _get_int("TRANSCRIPTION_HEDGE_AFTER", default=2000)
+TRANSCRIPTION_CACHE_SIZE = _get_int("TRANSCRIPTION_CACHE_SIZE", default=1024)
+TRANSCRIPTION_CACHE_TTL = _get_int("TRANSCRIPTION_CACHE_TTL", default=3600)
+TRANSCRIPTION_CACHE_DIR = _get_string("TRANSCRIPTION_CACHE_DIR", default="")
+AUDIO_TRANSCODE = _get_bool("AUDIO_TRANSCODE", default=False)
+AUDIO_TRANSCODE_CODEC = _get_string("AUDIO_TRANSCODE_CODEC", default="flac")
+if AUDIO_TRANSCODE_CODEC not in ("flac", "opus"):
+    raise ValueError("Configuration option AUDIO_TRANSCODE_CODEC must be flac or opus")
+FFMPEG_PATH = _get_string("FFMPEG_PATH", default="ffmpeg")
+VAD_ENABLED = _get_bool("VAD_ENABLED", default=False)
+VAD_THRESHOLD = _get_int("VAD_THRESHOLD", default=500)
+VAD_PADDING = _get_int("VAD_PADDING", default=300)
+VAD_SILENCE_TIMEOUT = _get_int("VAD_SILENCE_TIMEOUT", default=1500)
+AUDIO_EXPECTED_BITRATE = _get_int("AUDIO_EXPECTED_BITRATE", default=32000)
+AUDIO_MAX_BYTES = _get_int("AUDIO_MAX_BYTES", default=16 * 1024 * 1024)
+STATIC_DIR = _get_string("STATIC_DIR", default="/build")
+STATIC_MEMORY_LIMIT = _get_int("STATIC_MEMORY_LIMIT", default=1024 * 1024)
+SESSION_STORE = _get_string("SESSION_STORE", default="memory")
+if SESSION_STORE not in ("memory", "sqlite"):
+    raise ValueError("Configuration option SESSION_STORE must be memory or sqlite")
+SESSION_DB = _get_string("SESSION_DB", default="sessions.db")
+SESSION_TTL = _get_int("SESSION_TTL", default=1800)
+RESULTS_DB = _get_string("RESULTS_DB", default="results.db")
+RESULTS_BATCH_SIZE = _get_int("RESULTS_BATCH_SIZE", default=100)
+RESULTS_FLUSH_INTERVAL = _get_int("RESULTS_FLUSH_INTERVAL", default=1000)
+RESULTS_QUEUE_SIZE = _get_int("RESULTS_QUEUE_SIZE", default=10000)
+LEADERBOARD_SIZE = _get_int("LEADERBOARD_SIZE", default=10)
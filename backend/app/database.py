@@ -0,0 +1,37 @@
+import contextlib
+import sqlite3
+import threading
+from collections.abc import Iterator
+
+
+class Database:
+    """An SQLite database in WAL mode, so several workers can share it.
+
+    `schema` holds the statements that create its tables and indexes, they are
+    run when the database is first used.
+    """
+
+    def __init__(self, path: str, schema: list[str]) -> None:
+        self.path = path
+        self.schema = schema
+
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                yield connection
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connects on first use, so every worker opens its own connection.
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                for statement in self.schema:
+                    connection.execute(statement)
+            self._connection = connection
+        return self._connection
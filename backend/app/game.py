@@ -1,5 +1,6 @@
 import abc
 import asyncio
+import heapq
 import json
 import logging
 import random
@@ -7,107 +8,235 @@ import string
 import time
 from typing import Any
 
-import deepgram
-import simple_websocket
+import msgpack
 
+from . import audio
+from . import backends
+from . import cache
 from . import config
+from . import logs
+from . import metrics
+from . import results
+from . import rules
+from . import scheduler
+from . import sessions
+from . import transcode
+from . import transcription
+from . import websocket
 
 logger = logging.getLogger(__name__)
 
-deepgram_client = deepgram.Deepgram(
-    {"api_key": config.DEEPGRAM_API_KEY, "api_url": "https://api.beta.deepgram.com/v1"}
+
+def _create_backend() -> backends.Backend:
+    if config.TRANSCRIPTION_BACKEND == "local":
+        return backends.LocalBackend(
+            model=config.LOCAL_ASR_MODEL, workers=config.LOCAL_ASR_WORKERS
+        )
+    if config.TRANSCRIPTION_BACKEND == "fixture":
+        return backends.FixtureBackend(
+            transcript=config.FIXTURE_TRANSCRIPT, directory=config.FIXTURE_DIR
+        )
+    return backends.DeepgramBackend(
+        api_key=config.DEEPGRAM_API_KEY,
+        api_url=config.DEEPGRAM_API_URL,
+        pool_size=config.DEEPGRAM_POOL_SIZE,
+        timeout=config.DEEPGRAM_TIMEOUT,
+    )
+
+
+transcription_client = transcription.TranscriptionClient(
+    backend=_create_backend(),
+    cache=cache.TranscriptionCache(
+        size=config.TRANSCRIPTION_CACHE_SIZE,
+        ttl=config.TRANSCRIPTION_CACHE_TTL,
+        directory=config.TRANSCRIPTION_CACHE_DIR or None,
+    ),
+    scheduler=scheduler.Scheduler(
+        concurrency=config.TRANSCRIPTION_CONCURRENCY,
+        queue_size=config.TRANSCRIPTION_QUEUE_SIZE,
+    ),
+    retries=config.TRANSCRIPTION_RETRIES,
+    backoff=config.TRANSCRIPTION_RETRY_BACKOFF / 1000,
+    hedge_after=(
+        config.TRANSCRIPTION_HEDGE_AFTER / 1000 if config.TRANSCRIPTION_HEDGE else None
+    ),
 )
 
+session_store = sessions.create_store(
+    config.SESSION_STORE, path=config.SESSION_DB, ttl=config.SESSION_TTL
+)
+
+results_store = results.ResultStore(
+    path=config.RESULTS_DB,
+    batch_size=config.RESULTS_BATCH_SIZE,
+    flush_interval=config.RESULTS_FLUSH_INTERVAL / 1000,
+    queue_size=config.RESULTS_QUEUE_SIZE,
+)
+
+# Clients that offer this websocket subprotocol get messages as msgpack, and
+# cards as their class name and random parameters instead of the prompt,
+# which the client renders itself. Clients still send JSON.
+COMPACT_PROTOCOL = "gramjam.msgpack"
+
 DEFAULT_ERROR = {"type": "failure", "message": "I didn't quite catch that."}
+AUDIO_TOO_LONG_ERROR = {
+    "type": "failure",
+    "message": "Whoa, that's way more audio than I can handle.",
+}
+SERVER_BUSY_ERROR = {
+    "type": "failure",
+    "message": "Sorry, I'm swamped right now. Try again in a minute!",
+}
 
 
 class Card(abc.ABC):
+    """A challenge dealt to the player.
+
+    The verdict is the first of `verdicts` whose rule holds for the
+    transcription of the player's answer, see `rules.Validator`.
+
+    Cards that pick something at random list the attributes holding their
+    picks in `PARAMS` and accept them as keyword arguments, so a resumed game
+    deals the same card again.
+    """
+
+    PARAMS: tuple[str, ...] = ()
+
     def __init__(
         self,
         *,
         prompt: str,
-        options: deepgram.transcription.PrerecordedOptions,
+        options: dict,
         timeout: int,
+        verdicts: tuple[rules.Verdict, ...],
     ) -> None:
         self.prompt = prompt
-        self.options = options
         self.timeout = timeout
+        # Seconds the player can be kept waiting for a transcription,
+        # including retries, before the card is failed.
+        self.deadline = config.TRANSCRIPTION_DEADLINES.get(
+            type(self).__name__, config.TRANSCRIPTION_DEADLINE
+        )
+        self.validator = rules.compile(verdicts)
+        # Analysis features are turned on for whatever the rules read, so
+        # `options` only needs the other transcription options.
+        self.options = self.validator.options(type(self).__name__, options)
+        # Streaming only supports plain transcription options, analysis
+        # features such as topics and sentiment need the prerecorded API, so
+        # cards reading them are uploaded in pieces instead.
+        self.mode = config.TRANSCRIPTION_MODES.get(type(self).__name__, "prerecorded")
+        if self.mode == "streaming" and (
+            self.validator.features or not transcription_client.backend.streaming
+        ):
+            self.mode = "chunked"
+
+    def validate_response(self, response: dict) -> dict:
+        channels = response["results"]["channels"]
+        if not channels or not channels[0]["alternatives"]:
+            return DEFAULT_ERROR
+        return self.validator.verdict(channels[0]["alternatives"][0])
 
-    @abc.abstractmethod
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        pass
+    def is_decided(self, words: list[str]) -> bool:
+        # Called with the (lowercase) words heard so far while the player is
+        # still talking. Returning True ends the recording early, so it should
+        # only do so once validate_response is certain to succeed.
+        return self.validator.decided(words)
 
+    def state(self) -> dict[str, Any]:
+        return {param: getattr(self, param) for param in self.PARAMS}
+
+
+class CardRegistry:
+    """The cards that can be dealt, and how to deal them.
+
+    A card's weight makes it more likely to be dealt early, and to be in the
+    deck at all when the deck is smaller than the number of cards. Cards with
+    weight 0 are never dealt.
+    """
 
-class PurchaseTwitterCard(Card):
     def __init__(self) -> None:
-        super().__init__(
-            prompt="You accidentally bought Twitter and your own account drowned in a sea of troll accounts imitating you. Get angry, click the button, and say: “Some people don't like change, but you need to embrace change if the alternative is disaster”",
-            options={"analyze_sentiment": True, "sent_thresh": 0.0},
-            timeout=12,
+        self._cards: dict[str, type[Card]] = {}
+        self._weights: dict[str, float] = {}
+        self.size = 0
+
+    def register(self, card_class: type[Card]) -> type[Card]:
+        self._cards[card_class.__name__] = card_class
+        self._weights[card_class.__name__] = 1.0
+        return card_class
+
+    def configure(self, *, weights: dict[str, float], size: int) -> None:
+        for name, weight in weights.items():
+            if name not in self._cards:
+                raise ValueError(f"Unknown card {name} in CARD_WEIGHTS")
+            if weight < 0:
+                raise ValueError(f"Weight of {name} must not be negative")
+            self._weights[name] = weight
+        self._weights = {name: w for name, w in self._weights.items() if w > 0}
+        if not self._weights:
+            raise ValueError("CARD_WEIGHTS leaves no cards to deal")
+        enabled = len(self._weights)
+        self.size = min(size, enabled) if size > 0 else enabled
+
+    def deck(self) -> list[str]:
+        # Weighted sampling without replacement (Efraimidis and Spirakis),
+        # only names are picked, cards are built when they are dealt.
+        return heapq.nlargest(
+            self.size,
+            self._weights,
+            key=lambda name: random.random() ** (1 / self._weights[name]),
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
+    def deal(self, name: str, state: dict[str, Any]) -> Card:
+        return self._cards[name](**state)
 
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
 
-        sentiment_segments = alternatives[0].get("sentiment_segments") or []
-        if not any(
-            segment["sentiment"] == "negative" for segment in sentiment_segments
-        ):
-            return {
-                "type": "failure",
-                "message": "You call that angry? Well aren't you a saint.",
-            }
+registry = CardRegistry()
 
-        return {
-            "type": "success",
-            "message": "Yes, YES! Let the hate flow through you.",
-        }
 
+@registry.register
+class PurchaseTwitterCard(Card):
+
+    VERDICTS = (
+        rules.success(
+            "Yes, YES! Let the hate flow through you.",
+            when=rules.Sentiment("negative"),
+        ),
+        rules.failure("You call that angry? Well aren't you a saint."),
+    )
 
-class CryptoCard(Card):
     def __init__(self) -> None:
         super().__init__(
-            prompt="You have (accidentally?) invested your entire life savings in Crypto. Bitcoin and ethereum are down and there's no sign of a recovery. Give a rambly explaination to your spouse.",
-            options={"detect_topics": True},
-            timeout=40,
+            prompt="You accidentally bought Twitter and your own account drowned in a sea of troll accounts imitating you. Get angry, click the button, and say: “Some people don't like change, but you need to embrace change if the alternative is disaster”",
+            options={"sent_thresh": 0.0},
+            timeout=12,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
 
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
+@registry.register
+class CryptoCard(Card):
 
-        topics = alternatives[0].get("topics") or []
-        topics = {topic2["topic"] for topic1 in topics for topic2 in topic1["topics"]}
-        topics = topics.intersection(
-            {"finance", "banking", "inflation", "stock market", "cryptocurrency"}
-        )
+    VERDICTS = (
+        rules.success(
+            "Nice recovery!",
+            when=rules.Topics(
+                {"finance", "banking", "inflation", "stock market", "cryptocurrency"},
+                at_least=2,
+            ),
+        ),
+        rules.failure("Both your pockets and relationship are deep in the red!"),
+    )
 
-        if len(topics) < 2:
-            return {
-                "type": "failure",
-                "message": "Both your pockets and relationship are deep in the red!",
-            }
-
-        return {"type": "success", "message": "Nice recovery!"}
+    def __init__(self) -> None:
+        super().__init__(
+            prompt="You have (accidentally?) invested your entire life savings in Crypto. Bitcoin and ethereum are down and there's no sign of a recovery. Give a rambly explaination to your spouse.",
+            options={},
+            timeout=40,
+            verdicts=self.VERDICTS,
+        )
 
 
+@registry.register
 class HelloInForeignLanguageCard(Card):
 
     OPTIONS = [
@@ -116,78 +245,59 @@ class HelloInForeignLanguageCard(Card):
         ("French", "France", "fr", "bonjour"),
     ]
 
-    def __init__(self) -> None:
-        self.language, self.country, self.model, self.word = random.choice(self.OPTIONS)
+    PARAMS = ("language",)
+
+    def __init__(self, language: str | None = None) -> None:
+        if language is None:
+            option = random.choice(self.OPTIONS)
+        else:
+            option = next(o for o in self.OPTIONS if o[0] == language)
+        self.language, self.country, self.model, self.word = option
 
         super().__init__(
             prompt=f"You were born in California but you've been invited to compete for {self.country} in the Beijing Winter Olympics. Say hello in {self.language} ({self.word}).",
             options={"punctuate": False, "language": self.model},
             timeout=5,
+            verdicts=(
+                rules.success(
+                    "You're a multilingual wizard!", when=rules.Contains(self.word)
+                ),
+                rules.failure(f"Ouch! Your {self.language} needs a bit of work."),
+            ),
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
 
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        transcript = alternatives[0]["transcript"].lower()
-        if self.word not in transcript:
-            return {
-                "type": "failure",
-                "message": f"Ouch! Your {self.language} needs a bit of work.",
-            }
-
-        return {"type": "success", "message": "You're a multilingual wizard!"}
+@registry.register
+class TrappedFamilyCard(Card):
 
+    PARAMS = ("letter",)
 
-class TrappedFamilyCard(Card):
-    def __init__(self) -> None:
-        self.letter = random.choice(string.ascii_uppercase)
+    def __init__(self, letter: str | None = None) -> None:
+        self.letter = letter or random.choice(string.ascii_uppercase)
 
         super().__init__(
             prompt=f"You are trapped with family over the holidays and they want to play a game. Try to say over 10 words that start with the letter “{self.letter}”",
             options={"punctuate": False},
             timeout=30,
+            verdicts=(
+                rules.success(
+                    "You're a walking dictionary!",
+                    when=rules.Prefix(self.letter, at_least=10),
+                ),
+                rules.failure(
+                    "So close! You got: {matches}",
+                    when=rules.Prefix(self.letter, at_least=6),
+                ),
+                rules.failure(
+                    "Nice try! You got: {matches}",
+                    when=rules.Prefix(self.letter, at_least=1),
+                ),
+                rules.failure("Uh oh! Your vocab might need a little work."),
+            ),
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        words = set(word["word"].title() for word in alternatives[0]["words"])
-        matching = [word for word in words if word.startswith(self.letter)]
-        count = len(matching)
-        if count <= 0:
-            return {
-                "type": "failure",
-                "message": "Uh oh! Your vocab might need a little work.",
-            }
-        if count <= 5:
-            return {
-                "type": "failure",
-                "message": f"Nice try! You got: {', '.join(matching)}",
-            }
-        if count < 10:
-            return {
-                "type": "failure",
-                "message": f"So close! You got: {', '.join(matching)}",
-            }
-        return {"type": "success", "message": "You're a walking dictionary!"}
-
 
+@registry.register
 class SpeedTalkingCard(Card):
 
     TWISTERS = [
@@ -196,470 +306,556 @@ class SpeedTalkingCard(Card):
         "how much wood would a woodchuck chuck if a woodchuck could chuck wood",
     ]
 
-    def __init__(self) -> None:
-        self.twister = random.choice(self.TWISTERS)
+    PARAMS = ("twister",)
+
+    def __init__(self, twister: str | None = None) -> None:
+        self.twister = twister or random.choice(self.TWISTERS)
+        twister_words = frozenset(self.twister.split())
 
         super().__init__(
             prompt=f"You are home with another case of COVID and you discover a youtube video of the world's fastest talker. See if you can say this tongue twister before time is up: “{self.twister}”",
             options={"punctuate": False},
             timeout=5,
+            verdicts=(
+                rules.success(
+                    "Smooth talker!",
+                    when=rules.Keywords(
+                        twister_words, at_least=len(twister_words) / 2, distinct=True
+                    ),
+                ),
+                rules.failure("Cat got your tongue?"),
+            ),
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        transcript_words = set(
-            word["word"].lower() for word in alternatives[0]["words"]
-        )
-        twister_words = set(self.twister.split())
-        intersection = twister_words.intersection(transcript_words)
 
-        if len(intersection) < len(twister_words) / 2:
-            return {"type": "failure", "message": "Cat got your tongue?"}
-        return {"type": "success", "message": "Smooth talker!"}
+@registry.register
+class YouTubeContentCreatorCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "Hurray! You got new followers and can continue 2022.",
+            when=rules.Keywords(
+                {
+                    "like",
+                    "subscribe",
+                    "bell",
+                    "smash",
+                    "click",
+                    "hit",
+                    "sponsor",
+                    "favor",
+                    "algorithm",
+                    "youtube",
+                    "content",
+                    "video",
+                    "videos",
+                    "patreon",
+                },
+                at_least=5,
+            ),
+        ),
+        rules.failure(
+            "Your channel is now dead. You gotta follow directions - better luck next time!"
+        ),
+    )
 
-class YouTubeContentCreatorCard(Card):
     def __init__(self) -> None:
         super().__init__(
             prompt="You are a content creator and YouTube has cut their ad spend. Encourage your viewers to subscribe, smash that like button, click or hit the bell, etc.",
             options={"punctuate": False},
             timeout=10,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        words = alternatives[0]["words"]
-        keywords = [
-            "like",
-            "subscribe",
-            "bell",
-            "smash",
-            "click",
-            "hit",
-            "sponsor",
-            "favor",
-            "algorithm",
-            "youtube",
-            "content",
-            "video",
-            "videos",
-            "patreon",
-        ]
-        count = sum(1 for word in words if word["word"].lower() in keywords)
-
-        if count < 5:
-            return {
-                "type": "failure",
-                "message": "Your channel is now dead. You gotta follow directions - better luck next time!",
-            }
 
-        return {
-            "type": "success",
-            "message": "Hurray! You got new followers and can continue 2022.",
-        }
+@registry.register
+class TwitterHardcoreCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "Okay, I got it, you are extremely hard core. You can continue 2022.",
+            when=rules.Phrase("extremely hardcore"),
+        ),
+        rules.failure(
+            "That wasn't convincing. You need to be EXTREMELY HARDCORE! Better luck next time!"
+        ),
+    )
 
-class TwitterHardcoreCard(Card):
     def __init__(self) -> None:
         super().__init__(
             prompt="You survived the Twitter layoffs and were just informed that you now have to be “extremely hardcore” to keep your job. Affirm that you will be “extremely hardcore.”",
             options={"punctuate": False},
             timeout=10,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        transcript = alternatives[0]["transcript"].lower()
-        if "extremely hardcore" not in transcript:
-            return {
-                "type": "failure",
-                "message": "That wasn't convincing. You need to be EXTREMELY HARDCORE! Better luck next time!",
-            }
 
-        return {
-            "type": "success",
-            "message": "Okay, I got it, you are extremely hard core. You can continue 2022.",
-        }
+@registry.register
+class TwitterMoneyCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "You said nothing and I don't know who you are. But maybe that's the whole point? You can continue 2022.",
+            when=rules.Silent(),
+        ),
+        rules.success(
+            "At first I heard you say you are {match}, but then I thought I heard something else. Anyways, you can continue 2022.",
+            when=rules.Entities(at_least=2),
+        ),
+        rules.success(
+            "So you are {match}. Yes, I totally believe you. You can continue 2022.",
+            when=rules.Entities(at_least=1),
+        ),
+        rules.success(
+            "You said something but told me nothing about who you are. But maybe that's the whole point? You can continue 2022."
+        ),
+    )
 
-class TwitterMoneyCard(Card):
     def __init__(self) -> None:
-
         super().__init__(
             prompt=f"You want to become verified on Twitter. Tell me who you are, and pay me $20 dollars. Too much? Fine. $8.",
-            options={"detect_entities": True},
+            options={},
             timeout=10,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
 
-        transcript = alternatives[0]["transcript"]
-        if transcript == "":
-            return {
-                "type": "success",
-                "message": "You said nothing and I don't know who you are. But maybe that's the whole point? You can continue 2022.",
-            }
-
-        if "entities" in alternatives[0].keys():
-            entities = alternatives[0]["entities"]
-            if len(entities) > 1:
-                return {
-                    "type": "success",
-                    "message": "At first I heard you say you are {}, but then I thought I heard something else. Anyways, you can continue 2022.".format(
-                        entities[0]["value"]
-                    ),
-                }
-            elif len(entities) == 1:
-                return {
-                    "type": "success",
-                    "message": "So you are {}. Yes, I totally believe you. You can continue 2022.".format(
-                        entities[0]["value"]
-                    ),
-                }
-            else:
-                return {
-                    "type": "success",
-                    "message": "You said something but told me nothing about who you are. But maybe that's the whole point? You can continue 2022.",
-                }
+@registry.register
+class OverbookedFlightCard(Card):
 
+    ON_TOPIC = rules.Keywords(
+        {"air travel", "aircraft", "travel", "vacation", "tourism", "holidays"}
+    )
+
+    VERDICTS = (
+        rules.success(
+            "Hurray! You put such a positive spin on it. Continue 2022.",
+            when=rules.All(rules.SentimentScore(above=0), ON_TOPIC),
+        ),
+        rules.success(
+            "You went off topic, but I felt very very positive vibes. Continue 2022.",
+            when=rules.SentimentScore(above=0),
+        ),
+        rules.failure(
+            "You said some of the right stuff but you weren't very positive. Better luck next time!",
+            when=rules.All(rules.SentimentScore(below=0), ON_TOPIC),
+        ),
+        rules.failure(
+            "That was neither positive nor on track for the right topics. Better luck next time!"
+        ),
+    )
 
-class OverbookedFlightCard(Card):
     def __init__(self) -> None:
-
         super().__init__(
             prompt=f"You overbooked a flight and now you have angry passengers. Put a positive spin on telling them that you won't be paying for their hotel rooms either.",
-            options={"analyze_sentiment": True, "detect_topics": True},
+            options={},
             timeout=10,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
 
-        naiive_aggregate_sentiment = 0
-        if "sentiment_segments" in alternatives[0].keys():
-            sentiments = alternatives[0]["sentiment_segments"]
-            for segment in sentiments:
-                if segment["sentiment"] == "negative":
-                    naiive_aggregate_sentiment -= segment["confidence"]
-                elif segment["sentiment"] == "positive":
-                    naiive_aggregate_sentiment += segment["confidence"]
-
-        target_topics = [
-            "air travel",
-            "aircraft",
-            "travel",
-            "vacation",
-            "tourism",
-            "holidays",
-        ]
-        relevant = False
-        if "topics" in alternatives[0].keys():
-            topics = alternatives[0]["topics"]
-            print(topics)
-            for entry in topics:
-                if len(entry["topics"]) > 0:
-                    for topic in entry["topics"]:
-                        if topic in target_topics:
-                            relevant = True
-        words = alternatives[0]["words"]
-        relevant = (
-            sum(1 for word in words if word["word"].lower() in target_topics) >= 1
-        )
-
-        if naiive_aggregate_sentiment > 0 and relevant:
-            return {
-                "type": "success",
-                "message": "Hurray! You put such a positive spin on it. Continue 2022.",
-            }
-        elif naiive_aggregate_sentiment > 0 and not relevant:
-            return {
-                "type": "success",
-                "message": "You went off topic, but I felt very very positive vibes. Continue 2022.",
-            }
-        elif naiive_aggregate_sentiment < 0 and relevant:
-            return {
-                "type": "failure",
-                "message": "You said some of the right stuff but you weren't very positive. Better luck next time!",
-            }
-        else:
-            return {
-                "type": "failure",
-                "message": "That was neither positive nor on track for the right topics. Better luck next time!",
-            }
+@registry.register
+class PoliticalLettuceCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "Hurray! You know your veggetables and can continue 2022.",
+            when=rules.Keywords(
+                {
+                    "vegetables",
+                    "vegetable",
+                    "food",
+                    "diet",
+                    "fruit",
+                    "nutrition",
+                    "health",
+                    "cooking",
+                    "candy",
+                    "lettuce",
+                }
+            ),
+        ),
+        rules.failure(
+            "You did not talk enough about lettuce. Or any vegetables, really. Better luck next time!"
+        ),
+    )
 
-class PoliticalLettuceCard(Card):
     def __init__(self) -> None:
-
         super().__init__(
             prompt=f"You cut taxes for the rich and accidentally tanked the British pound. To make matters worse, now everyone compares you to a head of lettuce. Insist that your political career will last longer than a wilting head of lettuce.",
-            options={"detect_topics": True},
+            options={},
             timeout=10,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
 
-        target_topics = [
-            "vegetables",
-            "vegetable",
-            "food",
-            "diet",
-            "fruit",
-            "nutrition",
-            "health",
-            "cooking",
-            "candy",
-            "lettuce",
-        ]
-        relevant = False
-        if "topics" in alternatives[0].keys():
-            topics = alternatives[0]["topics"]
-            print(topics)
-            for entry in topics:
-                if len(entry["topics"]) > 0:
-                    for topic in entry["topics"]:
-                        if topic in target_topics:
-                            relevant = True
-        words = alternatives[0]["words"]
-        relevant = (
-            sum(1 for word in words if word["word"].lower() in target_topics) >= 1
-        )
-
-        if relevant:
-            return {
-                "type": "success",
-                "message": "Hurray! You know your veggetables and can continue 2022.",
-            }
-        return {
-            "type": "failure",
-            "message": "You did not talk enough about lettuce. Or any vegetables, really. Better luck next time!",
-        }
+@registry.register
+class CatfishCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "Hurray! You know how to talk L.O.V.E babe. Continue 2022.",
+            when=rules.Keywords(
+                {
+                    "love",
+                    "relationships",
+                    "relationship",
+                    "people",
+                    "family",
+                    "parenting",
+                    "child",
+                    "infants",
+                    "gender",
+                    "men",
+                    "women",
+                    "parents",
+                }
+            ),
+        ),
+        rules.failure(
+            "Really? You weren't really talking about love. Better luck next time!"
+        ),
+    )
 
-class CatfishCard(Card):
     def __init__(self) -> None:
-
         super().__init__(
             prompt=f"You're pretty sure you're getting catfished on Hinge. Talk to your friends about finding love in 2022.",
-            options={"detect_topics": True},
+            options={},
             timeout=20,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        target_topics = [
-            "love",
-            "relationships",
-            "relationship",
-            "people",
-            "family",
-            "parenting",
-            "child",
-            "infants",
-            "gender",
-            "men",
-            "women",
-            "parents",
-        ]
-        relevant = False
-        if "topics" in alternatives[0].keys():
-            topics = alternatives[0]["topics"]
-            print(topics)
-            for entry in topics:
-                if len(entry["topics"]) > 0:
-                    for topic in entry["topics"]:
-                        if topic in target_topics:
-                            relevant = True
-        words = alternatives[0]["words"]
-        relevant = (
-            sum(1 for word in words if word["word"].lower() in target_topics) >= 1
-        )
 
-        if relevant:
-            return {
-                "type": "success",
-                "message": "Hurray! You know how to talk L.O.V.E babe. Continue 2022.",
-            }
-        return {
-            "type": "failure",
-            "message": "Really? You weren't really talking about love. Better luck next time!",
-        }
+@registry.register
+class OscarSlapCard(Card):
 
+    VERDICTS = (
+        rules.success(
+            "You did it! But maybe don't pursue a career in voice acting just yet. Continue 2022.",
+            when=rules.Speakers(above=1),
+        ),
+        rules.success(
+            "It wasn't pretty, but I'll let you pass.",
+            when=rules.SpeakerConfidence(below=0.90),
+        ),
+        rules.failure(
+            "You're not fooling me... all I heard was one person. Better luck next time!",
+            when=rules.SpeakerConfidence(below=0.99),
+        ),
+        rules.failure("That's embarrassing... not even close."),
+    )
 
-class OscarSlapCard(Card):
     def __init__(self) -> None:
-
         super().__init__(
             prompt=f"Who won what at the 94th Academy Awards? You might not remember, but you most definitely remember that other thing. Now give your best impression of these two: \n\nChris Rock: \nOh, wow. Wow. Will Smith just smacked the **** out of me. \n\nWill Smith: Keep my wife’s name out your **** mouth.",
-            options={"diarize": True},
+            options={},
             timeout=15,
+            verdicts=self.VERDICTS,
         )
 
-    def validate_response(
-        self, response: deepgram.transcription.PrerecordedTranscriptionResponse
-    ) -> dict:
-        channels = response["results"]["channels"]
-        if not channels:
-            return DEFAULT_ERROR
-
-        alternatives = channels[0]["alternatives"]
-        if not alternatives:
-            return DEFAULT_ERROR
-
-        words = alternatives[0]["words"]
-        multispeaker = sum(word["speaker"] for word in words) > 1
-        confidence = min((word["speaker_confidence"] for word in words), default=1.0)
 
-        if multispeaker:
-            return {
-                "type": "success",
-                "message": "You did it! But maybe don't pursue a career in voice acting just yet. Continue 2022.",
-            }
+registry.configure(weights=config.CARD_WEIGHTS, size=config.DECK_SIZE)
 
-        if confidence < 0.90:
-            return {
-                "type": "success",
-                "message": "It wasn't pretty, but I'll let you pass.",
-            }
+AUDIO_START_TIMEOUT = 300
 
-        if confidence < 0.99:
-            return {
-                "type": "failure",
-                "message": "You're not fooling me... all I heard was one person. Better luck next time!",
-            }
+games_in_progress = 0
 
-        return {
-            "type": "failure",
-            "message": "That's embarrassing... not even close.",
-        }
 
+async def play(ws: websocket.WebSocket) -> None:
+    global games_in_progress
+    games_in_progress += 1
+    metrics.GAMES_IN_PROGRESS.inc()
+    logs.start_session(config.LOG_SAMPLE_RATE)
+    try:
+        await _play(ws)
+    finally:
+        games_in_progress -= 1
+        metrics.GAMES_IN_PROGRESS.dec()
 
-AUDIO_START_TIMEOUT = 300
 
+async def _play(ws: websocket.WebSocket) -> None:
+    if transcription_client.scheduler.full():
+        # Better to turn new players away than to make everyone wait longer.
+        logger.warning("Transcription queue is full, refusing game")
+        metrics.PLAYERS_REJECTED.inc()
+        await _send(ws, SERVER_BUSY_ERROR)
+        await _send(ws, {"type": "game_over", "score": 0})
+        return
 
-def play(ws: simple_websocket.Server) -> None:
     logger.info("Starting game")
-    cards = [c() for c in Card.__subclasses__()]
-    random.shuffle(cards)
-
-    score = 0
-    while cards:
-        card = cards.pop(0)
-        logger.info("Selected card: %s", type(card).__name__)
-
-        _send(ws, {"type": "new_card", "message": card.prompt})
+    session = sessions.Session.new([{"card": name} for name in registry.deck()])
+    await session_store.put(session)
+    await _send(ws, {"type": "session", "token": session.token})
+
+    while session.index < len(session.deck):
+        entry = session.deck[session.index]
+        card = registry.deal(entry["card"], entry.get("state", {}))
+        if "state" not in entry:
+            # Saved before the card is shown, so a resumed game deals the same
+            # card again.
+            entry["state"] = card.state()
+            if entry["state"]:
+                await session_store.put(session)
+        name = type(card).__name__
+        logs.card.set(name)
+        logger.info("Selected card: %s", name)
+
+        if ws.subprotocol == COMPACT_PROTOCOL:
+            await _send(ws, {"type": "new_card", "card": name, "params": card.state()})
+        else:
+            await _send(ws, {"type": "new_card", "message": card.prompt})
 
         card_start = time.time()
+        resumed = None
         while (timeout := AUDIO_START_TIMEOUT - time.time() + card_start) > 0:
-            data = _receive(ws, timeout)
+            data = await _receive(ws, timeout)
             if isinstance(data, dict):
                 if data.get("type") == "audio_start":
                     mimetype = data.get("mimetype")
                     break
+                if data.get("type") == "resume":
+                    resumed = await session_store.get(str(data.get("token")))
+                    if resumed is not None:
+                        break
+                    logger.info("No session to resume")
         else:
             # Timed out
             break
 
-        buffer = bytearray()
-        audio_start = time.time()
-        while (timeout := card.timeout - time.time() + audio_start) > 0:
-            data = _receive(ws, timeout)
-            if not isinstance(data, bytes):
+        if resumed is not None:
+            # Carry on with the resumed game, dealing its current card again.
+            await session_store.delete(session.token)
+            session = resumed
+            logger.info("Resuming game at card %s", session.index)
+            await _send(
+                ws,
+                {
+                    "type": "session",
+                    "token": session.token,
+                    "index": session.index,
+                    "score": session.score,
+                },
+            )
+            continue
+        metrics.AUDIO_START_WAIT.labels(name).observe(time.time() - card_start)
+
+        vad = None
+        if config.VAD_ENABLED:
+            vad = audio.VoiceActivityDetector.for_mimetype(
+                mimetype,
+                threshold=config.VAD_THRESHOLD,
+                padding=config.VAD_PADDING / 1000,
+            )
+
+        # Audio is either transcribed as it comes in, or buffered and uploaded
+        # once the player stops. Only WAV can be cut into pieces, any other
+        # audio would be uploaded in one piece anyway, so it's buffered like
+        # prerecorded audio to get trimming and transcoding.
+        mode = card.mode
+        if mode == "chunked" and not audio.is_wav(mimetype):
+            mode = "prerecorded"
+        stream = None
+        try:
+            if mode == "streaming":
+                stream = transcription_client.live(card.options)
+            elif mode == "chunked":
+                stream = transcription_client.chunked(
+                    card.options,
+                    mimetype=mimetype,
+                    seconds=config.TRANSCRIPTION_CHUNK_SECONDS,
+                    vad=vad,
+                )
+
+            transcoder = None
+            if (
+                stream is None
+                and config.AUDIO_TRANSCODE
+                and transcode.Transcoder.wanted(mimetype)
+            ):
+                transcoder = transcode.Transcoder(
+                    ffmpeg=config.FFMPEG_PATH, codec=config.AUDIO_TRANSCODE_CODEC
+                )
+                await transcoder.start()
+
+            buffer = None
+            if stream is None:
+                buffer = audio.AudioBuffer.for_duration(
+                    card.timeout,
+                    bitrate=config.AUDIO_EXPECTED_BITRATE,
+                    limit=config.AUDIO_MAX_BYTES,
+                )
+
+            size = 0
+            revision = 0
+            decided = False
+            too_long = False
+            audio_start = time.time()
+            try:
+                while (timeout := card.timeout - time.time() + audio_start) > 0:
+                    # Frames that arrived while the last ones were handled are
+                    # taken together.
+                    data = await _receive(ws, timeout, batch=True)
+                    if not isinstance(data, bytes):
+                        break
+                    size += len(data)
+                    if size > config.AUDIO_MAX_BYTES:
+                        too_long = True
+                        break
+                    if vad is not None:
+                        vad.feed(data)
+                    if stream is not None:
+                        stream.send(data)
+                        if stream.revision != revision:
+                            revision = stream.revision
+                            if card.is_decided(stream.words()):
+                                decided = True
+                                break
+                    else:
+                        buffer.extend(data)
+                        if transcoder is not None:
+                            await transcoder.write(data)
+                    if (
+                        vad is not None
+                        and vad.trailing_silence * 1000 >= config.VAD_SILENCE_TIMEOUT
+                    ):
+                        logger.info("Player stopped talking")
+                        break
+                recording_end = time.perf_counter()
+                metrics.AUDIO_RECEIVE.labels(name).observe(time.time() - audio_start)
+                metrics.AUDIO_BYTES.labels(name).observe(size)
+                logger.info("Received %s bytes of audio", size)
+
+                upload = None
+                if buffer is not None and not too_long:
+                    upload = buffer.view()
+                    if transcoder is not None:
+                        encoded = await transcoder.finish()
+                        if encoded is not None:
+                            upload, mimetype = encoded, transcoder.mimetype
+                    elif vad is not None:
+                        # Trimming only applies to uploads of the original audio,
+                        # the transcoder has already consumed the untrimmed audio.
+                        upload = vad.trim(upload)
+                        logger.info("Trimmed audio to %s bytes", len(upload))
+            finally:
+                if transcoder is not None:
+                    transcoder.kill()
+
+            if too_long:
+                logger.warning(
+                    "Player sent over %s bytes of audio", config.AUDIO_MAX_BYTES
+                )
+                if stream is not None:
+                    stream.cancel()
+                await _send(ws, AUDIO_TOO_LONG_ERROR)
                 break
-            buffer.extend(data)
-        logger.info("Received %s bytes of audio", len(buffer))
 
-        source = {"buffer": buffer, "mimetype": mimetype}
-        response = asyncio.run(
-            deepgram_client.transcription.prerecorded(source, card.options)
+            try:
+                if decided:
+                    # Whatever the player says next can't change the verdict, so
+                    # don't wait for the rest of the stream.
+                    logger.info("Card decided early")
+                    metrics.DECIDED_EARLY.labels(name).inc()
+                    response = stream.response(interim=True)
+                else:
+                    response = await asyncio.wait_for(
+                        _transcribe(card, stream, upload, mimetype), card.deadline
+                    )
+            except scheduler.SchedulerFull:
+                logger.warning("Transcription queue is full, ending game")
+                await _send(ws, SERVER_BUSY_ERROR)
+                break
+            except asyncio.TimeoutError:
+                logger.warning("No transcription within %ss", card.deadline)
+                metrics.TRANSCRIPTION_FAILURES.labels(name, "deadline").inc()
+                response = None
+            except transcription.TranscriptionError:
+                logger.warning("Transcription failed", exc_info=True)
+                metrics.TRANSCRIPTION_FAILURES.labels(name, "error").inc()
+                response = None
+        except BaseException:
+            # The game was abandoned, e.g. the player left mid-recording, so
+            # nobody will wait for the stream: stop it and give back its slot.
+            if stream is not None:
+                stream.cancel()
+            raise
+        finally:
+            if stream is not None:
+                stream.close()
+
+        if response is None:
+            response = DEFAULT_ERROR
+        else:
+            metrics.TRANSCRIPTION.labels(name, mode).observe(
+                time.perf_counter() - recording_end
+            )
+            logger.info(
+                "Received transcription: %s",
+                logs.Lazy(transcription.summarize, response),
+            )
+            validation_start = time.perf_counter()
+            response = card.validate_response(response)
+            metrics.VALIDATION.labels(name).observe(
+                time.perf_counter() - validation_start
+            )
+        metrics.VERDICTS.labels(name, response["type"]).inc()
+        session.cards.append(
+            {
+                "card": name,
+                "verdict": response["type"],
+                "seconds": round(time.perf_counter() - recording_end, 3),
+            }
         )
-        logger.info("Received Deepgram response: %s", response)
-
-        response = card.validate_response(response)
-        _send(ws, response)
+        # Saved before the player hears the verdict, so a failed card can't be
+        # retried by reconnecting.
+        if response["type"] == "success":
+            session.index += 1
+            session.score += 1
+            await session_store.put(session)
+        else:
+            await session_store.delete(session.token)
+        await _send(ws, response)
         if response["type"] == "failure":
             break
 
-        score += 1
+    await session_store.delete(session.token)
+    results_store.record(
+        game=logs.session.get(), score=session.score, cards=session.cards
+    )
+    await _send(ws, {"type": "game_over", "score": session.score})
+
 
-    _send(ws, {"type": "game_over", "score": score})
+async def _transcribe(
+    card: Card,
+    stream: transcription.LiveTranscription | transcription.ChunkedTranscription | None,
+    upload: bytes | memoryview | None,
+    mimetype: str | None,
+) -> dict:
+    if stream is not None:
+        return await stream.finish()
+    source = {"buffer": upload, "mimetype": mimetype}
+    return await transcription_client.prerecorded(source, card.options)
 
 
-def _send(ws: simple_websocket.Server, data: Any) -> None:
-    logger.info("Sending message: %s", data)
-    ws.send(json.dumps(data))
+async def _send(ws: websocket.WebSocket, data: Any) -> None:
+    logger.debug("Sending message: %s", data)
+    if ws.subprotocol == COMPACT_PROTOCOL:
+        await ws.send(msgpack.packb(data))
+    else:
+        await ws.send(json.dumps(data))
 
 
-def _receive(
-    ws: simple_websocket.Server, timeout: int | float | None
+async def _receive(
+    ws: websocket.WebSocket, timeout: int | float | None, *, batch: bool = False
 ) -> bytes | dict | None:
-    data = ws.receive(timeout)
+    if batch:
+        data = await ws.receive_batch(timeout)
+    else:
+        data = await ws.receive(timeout)
     if data is None:
         return None
     if isinstance(data, str):
         data = json.loads(data)
-        logger.info("Received message: %s", data)
+        logger.debug("Received message: %s", data)
         return data
     return data
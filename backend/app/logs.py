@@ -0,0 +1,112 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+from typing import Any, Callable
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(session)s %(card)s] %(message)s"
+
+session: contextvars.ContextVar[str] = contextvars.ContextVar("session", default="-")
+card: contextvars.ContextVar[str] = contextvars.ContextVar("card", default="-")
+# Whether the DEBUG and INFO records of the current session are kept.
+sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("sampled", default=True)
+
+_handler: logging.handlers.QueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+
+
+def start_session(sample_rate: float) -> str:
+    # Games run in tasks of their own, so each game sees only its own context.
+    session_id = uuid.uuid4().hex[:8]
+    session.set(session_id)
+    card.set("-")
+    sampled.set(random.random() < sample_rate)
+    return session_id
+
+
+class Lazy:
+    """Log argument that is only computed if the record is emitted."""
+
+    def __init__(self, function: Callable[..., Any], *args: Any) -> None:
+        self.function = function
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.function(*self.args))
+
+
+class ContextFilter(logging.Filter):
+    """Tags records with the session and card they were logged for, and drops
+    DEBUG and INFO records of sessions that weren't sampled."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not sampled.get():
+            return False
+        record.session = session.get()
+        record.card = card.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "session": getattr(record, "session", "-"),
+            "card": getattr(record, "card", "-"),
+            "message": record.getMessage(),
+        }
+        return json.dumps(data)
+
+
+def configured() -> bool:
+    return _handler is not None
+
+
+def setup(*, level: str, format: str) -> None:
+    """Sends log records through a queue to a background thread.
+
+    Filtering and merging arguments into the message happen on the calling
+    thread, everything else, including formatting and writing, on the
+    listener's thread, so logging never blocks the event loop on I/O.
+    """
+    global _handler
+
+    handler = logging.StreamHandler()
+    if format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    _handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level)
+
+    _start(handler)
+    atexit.register(_stop)
+    # The listener thread doesn't survive a fork, forked workers start their
+    # own.
+    os.register_at_fork(after_in_child=lambda: _start(handler))
+
+
+def _start(handler: logging.Handler) -> None:
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, handler)
+    _listener.start()
+
+
+def _stop() -> None:
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
@@ -0,0 +1,115 @@
+import os
+
+# With several workers, set PROMETHEUS_MULTIPROC_DIR so every worker writes its
+# metrics there and /metrics reports the sum over all of them. prometheus_client
+# turns on multiprocess mode if the variable is set at all, so an empty value
+# is removed before it's imported.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+if MULTIPROC_DIR is None:
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+import prometheus_client  # noqa: E402
+from prometheus_client import multiprocess  # noqa: E402
+from prometheus_client import Counter, Gauge, Histogram  # noqa: E402
+
+GAMES_IN_PROGRESS = Gauge(
+    "games_in_progress", "Games being played", multiprocess_mode="livesum"
+)
+AUDIO_START_WAIT = Histogram(
+    "audio_start_wait_seconds",
+    "Time from dealing a card until the player starts recording",
+    ["card"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+AUDIO_RECEIVE = Histogram(
+    "audio_receive_seconds",
+    "Time spent receiving the player's audio",
+    ["card"],
+    buckets=(0.5, 1, 2, 5, 10, 15, 20, 30, 40, 60),
+)
+AUDIO_BYTES = Histogram(
+    "audio_bytes",
+    "Audio received per card",
+    ["card"],
+    buckets=tuple(2**i * 1024 for i in range(4, 15)),
+)
+TRANSCRIPTION = Histogram(
+    "transcription_seconds",
+    "Time from the end of recording until the transcription is available",
+    ["card", "mode"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 60),
+)
+VALIDATION = Histogram(
+    "validation_seconds",
+    "Time spent validating a transcription",
+    ["card"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+VERDICTS = Counter("card_verdicts", "Verdicts given per card", ["card", "type"])
+DECIDED_EARLY = Counter(
+    "cards_decided_early", "Cards decided while the player was talking", ["card"]
+)
+
+TRANSCRIPTION_QUEUE = Histogram(
+    "transcription_queue_seconds",
+    "Time transcription requests wait for a free slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+TRANSCRIPTIONS_REJECTED = Counter(
+    "transcriptions_rejected", "Transcription requests turned away by a full queue"
+)
+TRANSCRIPTION_RETRIES = Counter(
+    "transcription_retries", "Transcription requests retried after an error"
+)
+TRANSCRIPTION_HEDGES = Counter(
+    "transcription_hedges", "Second transcription requests sent for slow requests"
+)
+TRANSCRIPTION_FAILURES = Counter(
+    "transcription_failures",
+    "Cards that got no transcription, because of errors or the deadline",
+    ["card", "reason"],
+)
+PLAYERS_REJECTED = Counter(
+    "players_rejected", "Games refused because the transcription queue was full"
+)
+
+CACHE_LOOKUPS = Counter(
+    "transcription_cache_lookups", "Transcription cache lookups", ["result"]
+)
+TRANSCODE_BYTES_IN = Counter("transcode_bytes_in", "Audio bytes fed to ffmpeg")
+TRANSCODE_BYTES_OUT = Counter("transcode_bytes_out", "Audio bytes encoded by ffmpeg")
+TRANSCODE_SECONDS = Counter(
+    "transcode_seconds", "Time spent waiting for ffmpeg after recording"
+)
+TRANSCODE_FAILURES = Counter("transcode_failures", "Failed transcodings")
+
+RESULTS_WRITTEN = Counter("results_written", "Game results written to the database")
+RESULTS_DROPPED = Counter(
+    "results_dropped", "Game results lost to a full queue or a database error"
+)
+
+
+def render() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return (
+        prometheus_client.generate_latest(registry),
+        prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
+def reset() -> None:
+    # Removes metrics left behind by an earlier run. Only call this before
+    # starting workers.
+    if MULTIPROC_DIR:
+        for name in os.listdir(MULTIPROC_DIR):
+            if name.endswith(".db"):
+                os.unlink(os.path.join(MULTIPROC_DIR, name))
+
+
+def worker_exited(pid: int) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
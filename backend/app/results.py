@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+from . import metrics
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """Finished games in an SQLite database, shared by all workers.
+
+    `record` only queues the result, a background task writes queued results
+    in batches, so games never wait on disk. The leaderboard is read through
+    an index on the score, so it costs the same however many games were
+    played.
+    """
+
+    def __init__(
+        self, *, path: str, batch_size: int, flush_interval: float, queue_size: int
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+
+        self._queue: list[tuple] = []
+        self._flushed: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._database = Database(
+            path,
+            [
+                "CREATE TABLE IF NOT EXISTS results (game TEXT NOT NULL, "
+                "score INTEGER NOT NULL, finished REAL NOT NULL, "
+                "cards TEXT NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS results_score "
+                "ON results (score DESC, finished)",
+            ],
+        )
+
+    def record(self, *, game: str, score: int, cards: list[dict]) -> None:
+        if len(self._queue) >= self.queue_size:
+            logger.warning("Result queue is full, dropping result")
+            metrics.RESULTS_DROPPED.inc()
+            return
+        self._queue.append((game, score, time.time(), json.dumps(cards)))
+        if self._task is None:
+            self._flushed = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        elif len(self._queue) >= self.batch_size:
+            self._flushed.set()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._flush()
+
+    def leaderboard(self, limit: int) -> list[dict]:
+        rows = self._execute(
+            "SELECT game, score, finished, cards FROM results "
+            "ORDER BY score DESC, finished LIMIT ?",
+            (limit,),
+        )
+        return [
+            {
+                "game": game,
+                "score": score,
+                "finished": finished,
+                "cards": json.loads(cards),
+            }
+            for game, score, finished, cards in rows
+        ]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flushed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flushed.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        while self._queue:
+            batch = self._queue[: self.batch_size]
+            del self._queue[: self.batch_size]
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except sqlite3.Error:
+                logger.exception("Failed to write %s results", len(batch))
+                metrics.RESULTS_DROPPED.inc(len(batch))
+            else:
+                metrics.RESULTS_WRITTEN.inc(len(batch))
+
+    def _write(self, batch: list[tuple]) -> None:
+        with self._database.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO results (game, score, finished, cards) "
+                "VALUES (?, ?, ?, ?)",
+                batch,
+            )
+
+    def _execute(self, sql: str, params: tuple) -> list[tuple]:
+        with self._database.transaction() as connection:
+            return connection.execute(sql, params).fetchall()
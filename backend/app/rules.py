@@ -0,0 +1,411 @@
+import abc
+import collections
+import dataclasses
+import functools
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Deepgram analysis features, with the options that only apply to them.
+FEATURES = {
+    "analyze_sentiment": ("sent_thresh",),
+    "detect_entities": (),
+    "detect_topics": (),
+    "diarize": (),
+}
+
+
+class Transcript:
+    """The parts of a transcription that rules look at.
+
+    Keyword, phrase and prefix matches for every rule of a card are collected
+    in a single pass over the words by `Validator.scan`. Everything else is
+    read from the response on first use.
+    """
+
+    def __init__(self, text: str, alternative: dict | None = None) -> None:
+        self.text = text
+        self.alternative = alternative or {}
+        self.words: list[str] = []
+        self.counts: collections.Counter[tuple[str, ...]] = collections.Counter()
+        self.prefixed: dict[str, dict[str, None]] = {}
+
+    @functools.cached_property
+    def topics(self) -> frozenset[str]:
+        return frozenset(
+            topic["topic"]
+            for entry in self.alternative.get("topics") or []
+            for topic in entry["topics"]
+        )
+
+    @functools.cached_property
+    def sentiment_segments(self) -> list[dict]:
+        return self.alternative.get("sentiment_segments") or []
+
+    @functools.cached_property
+    def entities(self) -> list[str]:
+        return [entity["value"] for entity in self.alternative.get("entities") or []]
+
+
+class Rule(abc.ABC):
+    # A monotonic rule that holds keeps holding as more words come in, so a
+    # card can be decided on it before the player stops talking.
+    monotonic = False
+    # Analysis features the rule reads from the response.
+    features: tuple[str, ...] = ()
+
+    def patterns(self) -> Iterable[tuple[str, ...]]:
+        return ()
+
+    def prefixes(self) -> Iterable[str]:
+        return ()
+
+    @abc.abstractmethod
+    def test(self, transcript: Transcript) -> bool:
+        pass
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return []
+
+
+@dataclasses.dataclass(frozen=True)
+class Keywords(Rule):
+    """At least `at_least` of the words are in `words`."""
+
+    words: frozenset[str]
+    at_least: float = 1
+    distinct: bool = False
+
+    monotonic = True
+
+    def __post_init__(self) -> None:
+        words = frozenset(word.lower() for word in self.words)
+        object.__setattr__(self, "words", words)
+        # Keywords of more than one word are matched like a phrase.
+        object.__setattr__(self, "_patterns", tuple(tuple(w.split()) for w in words))
+
+    def patterns(self) -> Iterable[tuple[str, ...]]:
+        return self._patterns
+
+    def test(self, transcript: Transcript) -> bool:
+        counts = transcript.counts
+        if self.distinct:
+            count = sum(1 for pattern in self._patterns if counts[pattern])
+        else:
+            count = sum(counts[pattern] for pattern in self._patterns)
+        return count >= self.at_least
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return [word for word in transcript.words if word in self.words]
+
+
+@dataclasses.dataclass(frozen=True)
+class Phrase(Rule):
+    """The words of `text` are said one after another."""
+
+    text: str
+
+    monotonic = True
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_pattern", tuple(self.text.lower().split()))
+
+    def patterns(self) -> Iterable[tuple[str, ...]]:
+        return (self._pattern,)
+
+    def test(self, transcript: Transcript) -> bool:
+        return transcript.counts[self._pattern] > 0
+
+
+@dataclasses.dataclass(frozen=True)
+class Contains(Rule):
+    """`text` appears anywhere in the transcript.
+
+    Unlike `Phrase` this doesn't depend on word boundaries, which matters for
+    languages that aren't written with spaces.
+    """
+
+    text: str
+
+    monotonic = True
+
+    def test(self, transcript: Transcript) -> bool:
+        return self.text.lower() in transcript.text
+
+
+@dataclasses.dataclass(frozen=True)
+class Prefix(Rule):
+    """At least `at_least` different words start with `prefix`."""
+
+    prefix: str
+    at_least: int = 1
+
+    monotonic = True
+
+    def prefixes(self) -> Iterable[str]:
+        return (self.prefix.lower(),)
+
+    def test(self, transcript: Transcript) -> bool:
+        return len(transcript.prefixed[self.prefix.lower()]) >= self.at_least
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return [word.title() for word in transcript.prefixed[self.prefix.lower()]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Topics(Rule):
+    """At least `at_least` of `topics` were detected."""
+
+    topics: frozenset[str]
+    at_least: int = 1
+
+    features = ("detect_topics",)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "topics", frozenset(self.topics))
+
+    def test(self, transcript: Transcript) -> bool:
+        return len(self.topics & transcript.topics) >= self.at_least
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return sorted(self.topics & transcript.topics)
+
+
+@dataclasses.dataclass(frozen=True)
+class Sentiment(Rule):
+    """Some part of the transcript has sentiment `label`."""
+
+    label: str
+
+    features = ("analyze_sentiment",)
+
+    def test(self, transcript: Transcript) -> bool:
+        return any(
+            segment["sentiment"] == self.label
+            for segment in transcript.sentiment_segments
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class SentimentScore(Rule):
+    """Confidence of positive segments minus that of negative segments is
+    above `above` and/or below `below`."""
+
+    above: float | None = None
+    below: float | None = None
+
+    features = ("analyze_sentiment",)
+
+    def test(self, transcript: Transcript) -> bool:
+        score = 0.0
+        for segment in transcript.sentiment_segments:
+            if segment["sentiment"] == "negative":
+                score -= segment["confidence"]
+            elif segment["sentiment"] == "positive":
+                score += segment["confidence"]
+        return (self.above is None or score > self.above) and (
+            self.below is None or score < self.below
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class Entities(Rule):
+    """At least `at_least` entities were detected."""
+
+    at_least: int = 1
+
+    features = ("detect_entities",)
+
+    def test(self, transcript: Transcript) -> bool:
+        return len(transcript.entities) >= self.at_least
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return transcript.entities
+
+
+@dataclasses.dataclass(frozen=True)
+class Silent(Rule):
+    """Nothing was said."""
+
+    def test(self, transcript: Transcript) -> bool:
+        return transcript.text == ""
+
+
+@dataclasses.dataclass(frozen=True)
+class Speakers(Rule):
+    """The speaker labels of all words add up to more than `above`, i.e.
+    someone other than the first speaker said something."""
+
+    above: int = 0
+
+    features = ("diarize",)
+
+    def test(self, transcript: Transcript) -> bool:
+        words = transcript.alternative.get("words") or []
+        return sum(word.get("speaker", 0) for word in words) > self.above
+
+
+@dataclasses.dataclass(frozen=True)
+class SpeakerConfidence(Rule):
+    """The least confident speaker label is below `below`."""
+
+    below: float
+
+    features = ("diarize",)
+
+    def test(self, transcript: Transcript) -> bool:
+        words = transcript.alternative.get("words") or []
+        confidence = min(
+            (word.get("speaker_confidence", 1.0) for word in words), default=1.0
+        )
+        return confidence < self.below
+
+
+@dataclasses.dataclass(frozen=True, init=False)
+class All(Rule):
+    """Every one of `rules` holds."""
+
+    rules: tuple[Rule, ...]
+
+    def __init__(self, *rules: Rule) -> None:
+        object.__setattr__(self, "rules", rules)
+
+    @property
+    def monotonic(self) -> bool:
+        return all(rule.monotonic for rule in self.rules)
+
+    @property
+    def features(self) -> tuple[str, ...]:
+        return tuple(feature for rule in self.rules for feature in rule.features)
+
+    def patterns(self) -> Iterable[tuple[str, ...]]:
+        return (pattern for rule in self.rules for pattern in rule.patterns())
+
+    def prefixes(self) -> Iterable[str]:
+        return (prefix for rule in self.rules for prefix in rule.prefixes())
+
+    def test(self, transcript: Transcript) -> bool:
+        return all(rule.test(transcript) for rule in self.rules)
+
+    def matches(self, transcript: Transcript) -> list[str]:
+        return [match for rule in self.rules for match in rule.matches(transcript)]
+
+
+@dataclasses.dataclass(frozen=True)
+class Verdict:
+    type: str
+    message: str
+    when: Rule | None = None
+
+
+def success(message: str, when: Rule | None = None) -> Verdict:
+    return Verdict("success", message, when)
+
+
+def failure(message: str, when: Rule | None = None) -> Verdict:
+    return Verdict("failure", message, when)
+
+
+class Validator:
+    """Picks the first verdict whose rule holds for a transcription.
+
+    Messages can refer to what the rule matched as `{match}` (the first match)
+    or `{matches}` (all of them). The last verdict must not have a rule.
+    """
+
+    def __init__(self, verdicts: tuple[Verdict, ...]) -> None:
+        if not verdicts or verdicts[-1].when is not None:
+            raise ValueError("The last verdict must apply unconditionally")
+        self.verdicts = verdicts
+
+        # Patterns are indexed by their last word, so a pattern can be checked
+        # as soon as the word that completes it has been seen.
+        index: dict[str, set[tuple[str, ...]]] = collections.defaultdict(set)
+        prefixes = set()
+        features = set()
+        for verdict in verdicts:
+            if verdict.when is not None:
+                for pattern in verdict.when.patterns():
+                    index[pattern[-1]].add(pattern)
+                prefixes.update(verdict.when.prefixes())
+                features.update(verdict.when.features)
+        self._index = {word: tuple(patterns) for word, patterns in index.items()}
+        self._prefixes = tuple(prefixes)
+        self.features = frozenset(features)
+        self._warned = False
+
+        first = verdicts[0]
+        self._decisive = None
+        if first.type == "success" and first.when is not None:
+            if first.when.monotonic:
+                self._decisive = first.when
+
+    def options(self, card: str, options: dict) -> dict:
+        # Returns `options` with exactly the analysis features that the rules
+        # read turned on. Anything else only adds latency and cost.
+        unused = [
+            feature
+            for feature in FEATURES
+            if options.get(feature) and feature not in self.features
+        ]
+        if unused and not self._warned:
+            logger.warning(
+                "%s requests %s but never reads the result", card, ", ".join(unused)
+            )
+            self._warned = True
+
+        dropped = {
+            key
+            for feature, params in FEATURES.items()
+            if feature not in self.features
+            for key in (feature, *params)
+        }
+        minimal = {k: v for k, v in options.items() if k not in dropped}
+        minimal.update((feature, True) for feature in sorted(self.features))
+        return minimal
+
+    def scan(self, transcript: Transcript, words: Iterable[str]) -> Transcript:
+        seen = transcript.words
+        counts = transcript.counts
+        prefixed = transcript.prefixed
+        for prefix in self._prefixes:
+            prefixed[prefix] = {}
+        for word in words:
+            seen.append(word)
+            for pattern in self._index.get(word, ()):
+                if len(pattern) == 1 or tuple(seen[-len(pattern) :]) == pattern:
+                    counts[pattern] += 1
+            for prefix in self._prefixes:
+                if word.startswith(prefix):
+                    prefixed[prefix][word] = None
+        return transcript
+
+    def verdict(self, alternative: dict) -> dict:
+        transcript = Transcript(alternative.get("transcript", "").lower(), alternative)
+        self.scan(
+            transcript,
+            (word["word"].lower() for word in alternative.get("words") or []),
+        )
+        for verdict in self.verdicts:
+            if verdict.when is None or verdict.when.test(transcript):
+                matches = verdict.when.matches(transcript) if verdict.when else []
+                message = verdict.message.format(
+                    match=matches[0] if matches else "", matches=", ".join(matches)
+                )
+                return {"type": verdict.type, "message": message}
+
+    def decided(self, words: list[str]) -> bool:
+        # True once the first verdict is a success that no further words can
+        # take back.
+        if self._decisive is None:
+            return False
+        transcript = self.scan(Transcript(" ".join(words)), words)
+        return self._decisive.test(transcript)
+
+
+@functools.lru_cache(maxsize=None)
+def compile(verdicts: tuple[Verdict, ...]) -> Validator:
+    # Cards with random parameters compile a validator per variant, which is
+    # then shared by every card dealt with the same parameters.
+    return Validator(verdicts)
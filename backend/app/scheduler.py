@@ -0,0 +1,76 @@
+import asyncio
+import collections
+import contextlib
+import time
+from typing import AsyncIterator
+
+from . import metrics
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+class Scheduler:
+    """Limits how many transcriptions run at once.
+
+    Requests over `concurrency` wait in a FIFO queue, so sessions are served in
+    the order they asked. At most `queue_size` requests wait, beyond that
+    `slot` raises SchedulerFull straight away rather than making everyone wait
+    longer.
+    """
+
+    def __init__(self, *, concurrency: int, queue_size: int) -> None:
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.running = 0
+
+        self._waiters: collections.deque[asyncio.Future[None]] = collections.deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def full(self) -> bool:
+        return self.running >= self.concurrency and self.waiting >= self.queue_size
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        await self._acquire()
+        metrics.TRANSCRIPTION_QUEUE.observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+            return
+        if self.waiting >= self.queue_size:
+            metrics.TRANSCRIPTIONS_REJECTED.inc()
+            raise SchedulerFull()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if future in self._waiters:
+                    self._waiters.remove(future)
+            else:
+                # The slot was handed over just before the cancellation.
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        # Hands the slot straight to the next waiter, so `running` only drops
+        # when nobody is waiting.
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
@@ -0,0 +1,196 @@
+import asyncio
+import collections
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from types import FrameType
+from typing import Any
+
+import uvicorn
+from uvicorn.supervisors import ChangeReload
+
+from . import asgi
+from . import config
+from . import game
+from . import logs
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+APPLICATION = "app.asgi:application"
+# A worker that exits is restarted after RESTART_DELAY seconds, doubled for
+# every restart in the last RESTART_WINDOW seconds. After RESTART_LIMIT such
+# restarts the workers are assumed to be crashing on startup and the
+# supervisor gives up.
+RESTART_DELAY = 0.5
+RESTART_WINDOW = 60
+RESTART_LIMIT = 5
+
+
+class Server(uvicorn.Server):
+    """uvicorn server that lets games in progress finish before exiting.
+
+    The first SIGTERM/SIGINT stops accepting connections and waits until no
+    games are left, or until WORKER_DRAIN_TIMEOUT expires. A second SIGINT
+    exits immediately.
+    """
+
+    draining = False
+    drain_deadline = 0.0
+
+    def run(self, sockets: list[socket.socket] | None = None) -> None:
+        # With APP_DEBUG, uvicorn serves from a freshly spawned process that
+        # hasn't set up logging yet.
+        if not logs.configured():
+            logs.setup(level=config.LOG_LEVEL, format=config.LOG_FORMAT)
+        super().run(sockets=sockets)
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        if self.draining:
+            super().handle_exit(sig, frame)
+            return
+
+        logger.info("Draining %s games in progress", game.games_in_progress)
+        self.draining = True
+        self.drain_deadline = time.monotonic() + config.WORKER_DRAIN_TIMEOUT
+        for server in self.servers:
+            server.close()
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.draining and not self.should_exit:
+            if game.games_in_progress == 0:
+                self.should_exit = True
+            elif time.monotonic() > self.drain_deadline:
+                logger.warning("Dropping %s games in progress", game.games_in_progress)
+                self.should_exit = True
+        return await super().on_tick(counter)
+
+    async def startup(self, sockets: list[socket.socket] | None = None) -> None:
+        await super().startup(sockets=sockets)
+        asyncio.get_running_loop().run_in_executor(None, asgi.warm_up)
+
+    async def shutdown(self, sockets: list[socket.socket] | None = None) -> None:
+        await super().shutdown(sockets=sockets)
+        await game.transcription_client.close()
+        await game.results_store.close()
+
+
+def run() -> None:
+    if config.APP_DEBUG:
+        _reload()
+    elif config.APP_WORKERS > 1:
+        _supervise(config.APP_WORKERS)
+    else:
+        _serve()
+
+
+def _config(app: Any, **kwargs: Any) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=config.APP_HOST,
+        port=config.APP_PORT,
+        lifespan="off",
+        ws_per_message_deflate=config.WS_PER_MESSAGE_DEFLATE,
+        # Leave uvicorn's loggers to the root logger, see logs.setup.
+        log_config=None,
+        **kwargs,
+    )
+
+
+def _serve(sock: socket.socket | None = None) -> None:
+    # The application object rather than its name, so forked workers start
+    # with it imported.
+    server = Server(_config(asgi.application))
+    server.run(sockets=[sock] if sock is not None else None)
+
+
+def _reload() -> None:
+    # What uvicorn.run does with reload=True, but with our Server, so games
+    # are drained and stores closed on every reload.
+    uvicorn_config = _config(APPLICATION, reload=True)
+    sock = uvicorn_config.bind_socket()
+    ChangeReload(
+        uvicorn_config, target=Server(uvicorn_config).run, sockets=[sock]
+    ).run()
+
+
+def _supervise(count: int) -> None:
+    # Every worker binds its own listening socket with SO_REUSEPORT, so the
+    # kernel spreads new connections across workers and a game stays in the
+    # worker that accepted it. Workers share nothing else.
+    workers = set()
+    stopping = False
+    failed = False
+    restarts: collections.deque[float] = collections.deque()
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 1
+            try:
+                _serve(_reuseport_socket())
+                code = 0
+            finally:
+                os._exit(code)
+        workers.add(pid)
+
+    def stop(sig: int, frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, sig)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    metrics.reset()
+    for _ in range(count):
+        spawn()
+    logger.info("Started %s workers", count)
+
+    while workers:
+        pid, status = os.wait()
+        workers.discard(pid)
+        metrics.worker_exited(pid)
+        if stopping:
+            continue
+
+        now = time.monotonic()
+        while restarts and now - restarts[0] > RESTART_WINDOW:
+            restarts.popleft()
+        if len(restarts) >= RESTART_LIMIT:
+            logger.error(
+                "Worker %s exited with status %s, %s restarts in %ss, giving up",
+                pid,
+                status,
+                len(restarts),
+                RESTART_WINDOW,
+            )
+            failed = True
+            stop(signal.SIGTERM, None)
+            continue
+
+        delay = RESTART_DELAY * 2 ** len(restarts)
+        logger.warning(
+            "Worker %s exited with status %s, restarting in %.1fs", pid, status, delay
+        )
+        time.sleep(delay)
+        if not stopping:
+            restarts.append(time.monotonic())
+            spawn()
+
+    if failed:
+        sys.exit(1)
+
+
+def _reuseport_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((config.APP_HOST, config.APP_PORT))
+    return sock
@@ -0,0 +1,160 @@
+import abc
+import asyncio
+import collections
+import json
+import secrets
+import time
+
+from .database import Database
+
+
+class Session:
+    """A game in progress, with enough state to carry on after a reconnect.
+
+    `deck` holds the cards in the order they are dealt, each as the card's
+    class name and, once dealt, the random parameters it was dealt with.
+    `index` points at the card being played. `cards` holds the outcome of
+    every card played so far.
+    """
+
+    def __init__(
+        self,
+        *,
+        token: str,
+        deck: list[dict],
+        index: int = 0,
+        score: int = 0,
+        cards: list[dict] | None = None,
+    ) -> None:
+        self.token = token
+        self.deck = deck
+        self.index = index
+        self.score = score
+        self.cards = cards if cards is not None else []
+
+    @classmethod
+    def new(cls, deck: list[dict]) -> "Session":
+        return cls(token=secrets.token_urlsafe(16), deck=deck)
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {
+                "deck": self.deck,
+                "index": self.index,
+                "score": self.score,
+                "cards": self.cards,
+            }
+        )
+
+    @classmethod
+    def loads(cls, token: str, data: str) -> "Session":
+        return cls(token=token, **json.loads(data))
+
+
+class SessionStore(abc.ABC):
+    """Sessions by token. Sessions expire `ttl` seconds after they were last
+    saved."""
+
+    def __init__(self, *, ttl: int) -> None:
+        self.ttl = ttl
+
+    @abc.abstractmethod
+    async def get(self, token: str) -> Session | None:
+        pass
+
+    @abc.abstractmethod
+    async def put(self, session: Session) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, token: str) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions kept in the worker's memory. With several workers a player
+    that reconnects to another worker can't resume."""
+
+    def __init__(self, *, ttl: int) -> None:
+        super().__init__(ttl=ttl)
+        # In order of expiry: every session lives for the same `ttl` after its
+        # last put, which moves it to the end.
+        self._sessions: collections.OrderedDict[str, tuple[float, str]] = (
+            collections.OrderedDict()
+        )
+
+    async def get(self, token: str) -> Session | None:
+        entry = self._sessions.get(token)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return Session.loads(token, entry[1])
+
+    async def put(self, session: Session) -> None:
+        now = time.time()
+        self._sessions[session.token] = (now + self.ttl, session.dumps())
+        self._sessions.move_to_end(session.token)
+        # Only the expired sessions at the front are looked at.
+        while self._sessions:
+            token, (expires, _) = next(iter(self._sessions.items()))
+            if expires > now:
+                break
+            del self._sessions[token]
+
+    async def delete(self, token: str) -> None:
+        self._sessions.pop(token, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in an SQLite database, shared by all workers on the host and
+    kept across restarts."""
+
+    def __init__(self, *, path: str, ttl: int) -> None:
+        super().__init__(ttl=ttl)
+        self.path = path
+
+        self._database = Database(
+            path,
+            [
+                "CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL, expires REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)",
+            ],
+        )
+
+    async def get(self, token: str) -> Session | None:
+        row = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM sessions WHERE token = ? AND expires > ?",
+            (token, time.time()),
+        )
+        if row is None:
+            return None
+        return Session.loads(token, row[0])
+
+    async def put(self, session: Session) -> None:
+        await asyncio.to_thread(self._put, session)
+
+    async def delete(self, token: str) -> None:
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE token = ?", (token,)
+        )
+
+    def _put(self, session: Session) -> None:
+        now = time.time()
+        with self._database.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (token, data, expires) "
+                "VALUES (?, ?, ?)",
+                (session.token, session.dumps(), now + self.ttl),
+            )
+            connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def _execute(self, sql: str, params: tuple) -> tuple | None:
+        with self._database.transaction() as connection:
+            return connection.execute(sql, params).fetchone()
+
+
+def create_store(kind: str, *, path: str, ttl: int) -> SessionStore:
+    if kind == "sqlite":
+        return SqliteSessionStore(path=path, ttl=ttl)
+    return MemorySessionStore(ttl=ttl)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import re
+import threading
+
+from asgiref.typing import ASGIReceiveCallable, ASGISendCallable, HTTPScope
+
+logger = logging.getLogger(__name__)
+
+# Build tools put a content hash in the names of files that never change,
+# e.g. main.3f2a8c1d.js.
+HASHED = re.compile(r"\.[0-9a-f]{8,}\.")
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+CHUNK_SIZE = 256 * 1024
+
+
+class Asset:
+    def __init__(self, path: str, *, encoding: str | None, in_memory: bool) -> None:
+        stat = os.stat(path)
+        self.path = path
+        self.encoding = encoding
+        self.size = stat.st_size
+        suffix = f"-{encoding}" if encoding else ""
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'.encode()
+        self.data: bytes | None = None
+        if in_memory:
+            with open(path, "rb") as f:
+                self.data = f.read()
+
+
+class File:
+    """A file of the build, with its precompressed variants."""
+
+    def __init__(
+        self, path: str, *, immutable: bool, variants: list[Asset], memory_limit: int
+    ) -> None:
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type in (
+            "application/javascript",
+            "application/json",
+            "image/svg+xml",
+        ):
+            self.content_type += "; charset=utf-8"
+        self.cache_control = (
+            b"public, max-age=31536000, immutable" if immutable else b"no-cache"
+        )
+        self.identity = Asset(
+            path, encoding=None, in_memory=os.path.getsize(path) <= memory_limit
+        )
+        self.variants = variants
+
+    def select(self, accept_encoding: str) -> Asset:
+        accepted = _accepted_encodings(accept_encoding)
+        for asset in self.variants:
+            if asset.encoding in accepted:
+                return asset
+        return self.identity
+
+
+class StaticFiles:
+    """ASGI app serving a frontend build from under `prefix`.
+
+    The build is indexed once, so requests never touch the file system to find
+    a file, and files up to `memory_limit` bytes are kept in memory. `.br` and
+    `.gz` files next to a file are served instead of it to clients that accept
+    them, see frontend/scripts/precompress.js. Files with a content hash in
+    their name are cached by browsers for good, everything else is
+    revalidated with its ETag.
+    """
+
+    def __init__(self, directory: str, *, prefix: str, memory_limit: int) -> None:
+        self.directory = directory
+        self.prefix = prefix
+        self.memory_limit = memory_limit
+
+        self._files: dict[str, File] | None = None
+        self._lock = threading.Lock()
+
+    def index(self) -> None:
+        with self._lock:
+            if self._files is not None:
+                return
+            files = {}
+            for root, _, names in os.walk(self.directory):
+                names = set(names)
+                for name in names:
+                    if name.endswith((".br", ".gz")):
+                        continue
+                    path = os.path.join(root, name)
+                    variants = [
+                        Asset(path + suffix, encoding=encoding, in_memory=True)
+                        for encoding, suffix in ENCODINGS
+                        if name + suffix in names
+                        and os.path.getsize(path + suffix) <= self.memory_limit
+                    ]
+                    relative = os.path.relpath(path, self.directory)
+                    files[relative.replace(os.sep, "/")] = File(
+                        path,
+                        immutable=bool(HASHED.search(name)),
+                        variants=variants,
+                        memory_limit=self.memory_limit,
+                    )
+            logger.info("Indexed %s static files in %s", len(files), self.directory)
+            self._files = files
+
+    def matches(self, path: str) -> bool:
+        return path == self.prefix or path.startswith(self.prefix + "/")
+
+    async def __call__(
+        self, scope: HTTPScope, receive: ASGIReceiveCallable, send: ASGISendCallable
+    ) -> None:
+        if self._files is None:
+            await asyncio.to_thread(self.index)
+
+        if scope["method"] not in ("GET", "HEAD"):
+            await _respond(send, 405, b"Method not allowed")
+            return
+        path = scope["path"][len(self.prefix) :].lstrip("/") or "index.html"
+        file = self._files.get(path)
+        if file is None:
+            await _respond(send, 404, b"Not found")
+            return
+
+        headers = dict(scope["headers"])
+        asset = file.select(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        response_headers = [
+            (b"content-type", file.content_type.encode()),
+            (b"cache-control", file.cache_control),
+            (b"etag", asset.etag),
+        ]
+        if file.variants:
+            response_headers.append((b"vary", b"accept-encoding"))
+        if asset.encoding is not None:
+            response_headers.append((b"content-encoding", asset.encoding.encode()))
+
+        if asset.etag in _etags(headers.get(b"if-none-match", b"")):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": response_headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        response_headers.append((b"content-length", str(asset.size).encode()))
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": response_headers}
+        )
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif asset.data is not None:
+            await send({"type": "http.response.body", "body": asset.data})
+        else:
+            await _send_file(send, asset.path)
+
+
+async def _send_file(send: ASGISendCallable, path: str) -> None:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            more = len(chunk) == CHUNK_SIZE
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+            if not more:
+                return
+
+
+async def _respond(send: ASGISendCallable, status: int, body: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for item in header.split(","):
+        encoding, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def _etags(header: bytes) -> set[bytes]:
+    return {tag.strip().removeprefix(b"W/") for tag in header.split(b",")}
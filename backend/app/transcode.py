@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Uncompressed formats worth shrinking. Anything else, like the browser's
+# Ogg/Opus, is already compact and is uploaded as is.
+RAW_MIMETYPES = {
+    "audio/wav",
+    "audio/wave",
+    "audio/x-wav",
+    "audio/vnd.wave",
+    "audio/aiff",
+    "audio/x-aiff",
+}
+
+CODECS = {
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio/flac"),
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"], "audio/ogg"),
+}
+
+
+class Transcoder:
+    """Downsamples audio to 16 kHz mono and re-encodes it with ffmpeg.
+
+    Frames are piped into ffmpeg as they arrive, so most of the encoding is
+    done by the time the player stops talking.
+    """
+
+    def __init__(self, *, ffmpeg: str, codec: str) -> None:
+        self.ffmpeg = ffmpeg
+        self.args, self.mimetype = CODECS[codec]
+        self.bytes_in = 0
+
+        self._process: asyncio.subprocess.Process | None = None
+        self._output: asyncio.Task[bytes] | None = None
+        self._failed = False
+
+    @staticmethod
+    def wanted(mimetype: str | None) -> bool:
+        return mimetype is not None and mimetype.split(";")[0].lower() in RAW_MIMETYPES
+
+    async def start(self) -> None:
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                self.ffmpeg,
+                "-loglevel",
+                "error",
+                "-i",
+                "pipe:0",
+                "-ac",
+                "1",
+                "-ar",
+                "16000",
+                *self.args,
+                "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+        except OSError:
+            logger.warning("Could not start %s", self.ffmpeg, exc_info=True)
+            self._failed = True
+            return
+        self._output = asyncio.create_task(self._process.stdout.read())
+
+    async def write(self, data: bytes) -> None:
+        self.bytes_in += len(data)
+        if self._failed:
+            return
+        try:
+            self._process.stdin.write(data)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            self._failed = True
+
+    async def finish(self) -> bytes | None:
+        # Returns the encoded audio, or None if ffmpeg failed, in which case
+        # the caller should upload the original audio instead.
+        if self._failed and self._process is None:
+            metrics.TRANSCODE_FAILURES.inc()
+            return None
+
+        start = time.perf_counter()
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            self._failed = True
+        output = await self._output
+        code = await self._process.wait()
+        elapsed = time.perf_counter() - start
+
+        if self._failed or code != 0 or not output:
+            logger.warning("Transcoding failed with exit code %s", code)
+            metrics.TRANSCODE_FAILURES.inc()
+            return None
+
+        metrics.TRANSCODE_BYTES_IN.inc(self.bytes_in)
+        metrics.TRANSCODE_BYTES_OUT.inc(len(output))
+        metrics.TRANSCODE_SECONDS.inc(elapsed)
+        logger.info(
+            "Transcoded %s bytes to %s bytes in %.3fs",
+            self.bytes_in,
+            len(output),
+            elapsed,
+        )
+        return output
+
+    def kill(self) -> None:
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
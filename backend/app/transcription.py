@@ -0,0 +1,438 @@
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import random
+import statistics
+import time
+from typing import TYPE_CHECKING, AsyncContextManager
+
+from . import audio
+from . import backends
+from . import cache as cache_
+from . import metrics
+from . import scheduler as scheduler_
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+TranscriptionError = backends.TranscriptionError
+
+
+class TranscriptionClient:
+    """Transcription client shared by every game, see `backends` for the
+    speech recognizers it can use.
+
+    With a `scheduler`, every request and live stream takes one of its slots
+    while it runs.
+
+    Prerecorded requests that fail with a transient error are retried up to
+    `retries` times with exponential backoff starting at `backoff` seconds.
+    With `hedge_after`, a second request is raced against the first once that
+    has taken longer than 95% of recent requests (or `hedge_after` seconds
+    until there have been enough requests to tell).
+    """
+
+    # Requests remembered for the hedging threshold, and how many are needed
+    # before it is used.
+    LATENCY_WINDOW = 200
+    MIN_LATENCIES = 20
+
+    def __init__(
+        self,
+        *,
+        backend: backends.Backend,
+        cache: cache_.TranscriptionCache | None = None,
+        scheduler: scheduler_.Scheduler | None = None,
+        retries: int = 0,
+        backoff: float = 0.2,
+        hedge_after: float | None = None,
+    ) -> None:
+        self.backend = backend
+        self.cache = cache
+        self.scheduler = scheduler
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+
+        self._latencies: collections.deque[float] = collections.deque(
+            maxlen=self.LATENCY_WINDOW
+        )
+
+    def live(self, options: dict) -> "LiveTranscription":
+        return LiveTranscription(self, options)
+
+    def chunked(
+        self,
+        options: dict,
+        *,
+        mimetype: str | None,
+        seconds: float,
+        vad: audio.VoiceActivityDetector | None = None,
+    ) -> "ChunkedTranscription":
+        return ChunkedTranscription(
+            self, options, mimetype=mimetype, seconds=seconds, vad=vad
+        )
+
+    async def prerecorded(self, source: dict, options: dict) -> dict:
+        if self.cache is None:
+            return await self._prerecorded(source, options)
+
+        params = backends.query_params(options)
+        if self.backend.name != "deepgram":
+            # Keeps the cached Deepgram responses valid as they were.
+            params.append(("backend", self.backend.name))
+        key = self.cache.key(source["buffer"], params)
+        response = await self.cache.get(key)
+        if response is None:
+            response = await self._prerecorded(source, options)
+            await self.cache.put(key, response)
+        return response
+
+    async def _prerecorded(self, source: dict, options: dict) -> dict:
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged(source, options)
+            except TranscriptionError as e:
+                if not e.transient or attempt >= self.retries:
+                    raise
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.0)
+                logger.warning("%s, retrying in %.2fs", e, delay)
+                metrics.TRANSCRIPTION_RETRIES.inc()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, source: dict, options: dict) -> dict:
+        first = asyncio.create_task(self._attempt(source, options))
+        delay = self._hedge_delay()
+        if delay is None:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._can_hedge():
+                metrics.TRANSCRIPTION_HEDGES.inc()
+                tasks.add(asyncio.create_task(self._attempt(source, options)))
+            # The first answer wins. If a request fails the other one gets to
+            # finish, the error is only raised when both have failed.
+            while True:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _hedge_delay(self) -> float | None:
+        if self.hedge_after is None:
+            return None
+        if len(self._latencies) < self.MIN_LATENCIES:
+            return self.hedge_after
+        return statistics.quantiles(self._latencies, n=20)[-1]
+
+    def _can_hedge(self) -> bool:
+        # A hedged request is extra load, so only send one if it won't have
+        # to queue.
+        scheduler = self.scheduler
+        return scheduler is None or scheduler.running < scheduler.concurrency
+
+    async def _attempt(self, source: dict, options: dict) -> dict:
+        async with self._slot():
+            start = time.perf_counter()
+            response = await self.backend.transcribe(source, options)
+            self._latencies.append(time.perf_counter() - start)
+            return response
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def _slot(self) -> AsyncContextManager[None]:
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot()
+
+
+class LiveTranscription:
+    """Audio stream forwarded to Deepgram while the player is still talking.
+    Only backends that support streaming can be used.
+
+    `send` never blocks. Frames are queued until the socket is open, so the
+    connection is set up while the first frames arrive. `finish` closes the
+    stream and returns the final results in the same shape as a prerecorded
+    response.
+    """
+
+    def __init__(self, client: TranscriptionClient, options: dict) -> None:
+        self.client = client
+        self.options = options
+
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+        self._finals: list[dict] = []
+        self._interim: dict | None = None
+        self._metadata: dict | None = None
+        # Bumped on every result so callers can skip unchanged interim words.
+        self.revision = 0
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, data: bytes) -> None:
+        self._queue.put_nowait(data)
+
+    async def finish(self) -> dict:
+        self.close()
+        await self._task
+        return self.response()
+
+    def close(self) -> None:
+        self._queue.put_nowait(None)
+
+    def cancel(self) -> None:
+        # Drops the stream without waiting for its results.
+        self._task.cancel()
+
+    def words(self) -> list[str]:
+        alternatives = list(self._finals)
+        if self._interim is not None:
+            alternatives.append(self._interim)
+        return [word["word"].lower() for a in alternatives for word in a["words"]]
+
+    def response(self, *, interim: bool = False) -> dict:
+        alternatives = list(self._finals)
+        if interim and self._interim is not None:
+            alternatives.append(self._interim)
+        transcript = " ".join(a["transcript"] for a in alternatives if a["transcript"])
+        words = [word for a in alternatives for word in a["words"]]
+        return {
+            "metadata": self._metadata,
+            "results": {
+                "channels": [
+                    {"alternatives": [{"transcript": transcript, "words": words}]}
+                ]
+            },
+        }
+
+    async def _run(self) -> None:
+        import aiohttp
+
+        async with self.client._slot():
+            try:
+                await self._stream()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise TranscriptionError(f"DG: {e!r}") from e
+
+    async def _stream(self) -> None:
+        async with self.client.backend.connect(self.options) as ws:
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                while (data := await self._queue.get()) is not None:
+                    await ws.send_bytes(data)
+                # An empty frame tells Deepgram the stream is finished, it then
+                # flushes the remaining results and closes the socket.
+                await ws.send_bytes(b"")
+                await receiver
+            finally:
+                receiver.cancel()
+
+    async def _receive(self, ws: "aiohttp.ClientWebSocketResponse") -> None:
+        import aiohttp
+
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            if "channel" not in data:
+                self._metadata = data
+                continue
+            alternative = data["channel"]["alternatives"][0]
+            if data.get("is_final"):
+                self._finals.append(alternative)
+                self._interim = None
+            else:
+                self._interim = alternative
+            self.revision += 1
+
+
+class ChunkedTranscription:
+    """Audio uploaded a piece at a time while the player is still talking.
+
+    Every `seconds` of audio is sent off as a WAV file of its own in the
+    background, preferably at a pause if a voice activity detector is given.
+    `finish` uploads the rest and merges the results in order, so the wait
+    after the player stops only covers the last piece. Audio that isn't WAV
+    is uploaded in one piece by `finish`.
+    """
+
+    # Audio is cut regardless of pauses once a piece is this much too long.
+    MAX_OVERRUN = 1.5
+
+    def __init__(
+        self,
+        client: TranscriptionClient,
+        options: dict,
+        *,
+        mimetype: str | None,
+        seconds: float,
+        vad: audio.VoiceActivityDetector | None = None,
+    ) -> None:
+        self.client = client
+        self.options = options
+        self.mimetype = mimetype
+        self.seconds = seconds
+        self.vad = vad
+
+        self._pending = bytearray()
+        self._header: bytearray | None = None
+        self._supported = True
+        self._chunk_size = 0
+        self._block_align = 1
+        self._byte_rate = 0
+        self._uploaded = 0
+        # Upload tasks in order, with the time their audio starts at.
+        self._chunks: list[tuple[float, asyncio.Task[dict]]] = []
+        # Bumped whenever a piece is transcribed.
+        self.revision = 0
+
+    def send(self, data: bytes) -> None:
+        self._pending.extend(data)
+        if self._header is None:
+            if not self._supported or not self._parse_header():
+                return
+
+        size = len(self._pending)
+        if size < self._chunk_size:
+            return
+        pause = self.vad is None or self.vad.trailing_silence > 0
+        if pause or size >= self._chunk_size * self.MAX_OVERRUN:
+            self._upload(size - size % self._block_align)
+
+    async def finish(self) -> dict:
+        if self._pending or not self._chunks:
+            self._upload(len(self._pending))
+        try:
+            await asyncio.gather(*(task for _, task in self._chunks))
+        finally:
+            self.close()
+        return self.response()
+
+    def close(self) -> None:
+        for _, task in self._chunks:
+            task.cancel()
+
+    def cancel(self) -> None:
+        self.close()
+
+    def words(self) -> list[str]:
+        return [
+            word["word"].lower()
+            for _, alternative in self._transcribed()
+            for word in alternative["words"]
+        ]
+
+    def response(self, *, interim: bool = False) -> dict:
+        # Merges the pieces transcribed so far, up to the first one that isn't.
+        # `interim` is accepted for symmetry with LiveTranscription.
+        merged = {"transcript": "", "words": []}
+        for offset, alternative in self._transcribed():
+            if alternative["transcript"]:
+                merged["transcript"] = " ".join(
+                    filter(None, [merged["transcript"], alternative["transcript"]])
+                )
+            shift = len(merged["words"])
+            for word in alternative["words"]:
+                merged["words"].append(
+                    {
+                        **word,
+                        "start": word["start"] + offset,
+                        "end": word["end"] + offset,
+                    }
+                )
+            for key in ("topics", "sentiment_segments", "entities"):
+                for segment in alternative.get(key) or []:
+                    segment = dict(segment)
+                    for index in ("start_word", "end_word"):
+                        if index in segment:
+                            segment[index] += shift
+                    merged.setdefault(key, []).append(segment)
+
+        metadata = None
+        if self._chunks and self._chunks[0][1].done():
+            metadata = self._chunks[0][1].result().get("metadata")
+        return {
+            "metadata": metadata,
+            "results": {"channels": [{"alternatives": [merged]}]},
+        }
+
+    def _transcribed(self) -> list[tuple[float, dict]]:
+        alternatives = []
+        for offset, task in self._chunks:
+            if not task.done() or task.cancelled() or task.exception() is not None:
+                break
+            channels = task.result()["results"]["channels"]
+            if channels and channels[0]["alternatives"]:
+                alternatives.append((offset, channels[0]["alternatives"][0]))
+        return alternatives
+
+    def _parse_header(self) -> bool:
+        try:
+            parsed = audio.parse_wav_header(self._pending)
+        except ValueError:
+            self._supported = False
+            return False
+        if parsed is None:
+            return False
+
+        data_offset, fmt = parsed
+        self._byte_rate, self._block_align = fmt[3], max(1, fmt[4])
+        self._chunk_size = int(self.seconds * self._byte_rate)
+        self._chunk_size -= self._chunk_size % self._block_align
+        self._header = self._pending[:data_offset]
+        del self._pending[:data_offset]
+        return True
+
+    def _upload(self, size: int) -> None:
+        if self._header is None:
+            source = {"buffer": bytes(self._pending), "mimetype": self.mimetype}
+            offset = 0.0
+        else:
+            header = bytearray(self._header)
+            audio.set_wav_size(header, size)
+            source = {
+                "buffer": bytes(header + self._pending[:size]),
+                "mimetype": "audio/wav",
+            }
+            offset = self._uploaded / self._byte_rate
+            self._uploaded += size
+        del self._pending[:size]
+
+        task = asyncio.create_task(self.client.prerecorded(source, self.options))
+        task.add_done_callback(self._chunk_done)
+        self._chunks.append((offset, task))
+
+    def _chunk_done(self, task: asyncio.Task) -> None:
+        self.revision += 1
+
+
+def summarize(response: dict) -> str:
+    # A line about a response for the logs, which leaves out the words.
+    request_id = (response.get("metadata") or {}).get("request_id")
+    channels = response["results"]["channels"]
+    if not channels or not channels[0]["alternatives"]:
+        return f"request {request_id}: no transcript"
+    alternative = channels[0]["alternatives"][0]
+    transcript = alternative.get("transcript", "")
+    if len(transcript) > 80:
+        transcript = transcript[:77] + "..."
+    return (
+        f"request {request_id}: {len(alternative.get('words') or [])} words, "
+        f"confidence {alternative.get('confidence', 0):.2f}, {transcript!r}"
+    )
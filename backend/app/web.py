@@ -0,0 +1,28 @@
+import flask
+
+from . import config
+from . import game
+from . import metrics
+
+# The React app is served by `static.StaticFiles`, see asgi.py.
+app = flask.Flask(__name__, static_folder=None)
+
+
+@app.route("/metrics")
+def serve_metrics() -> flask.Response:
+    data, content_type = metrics.render()
+    return flask.Response(data, content_type=content_type)
+
+
+@app.route("/leaderboard")
+def serve_leaderboard() -> flask.Response:
+    limit = min(
+        flask.request.args.get("limit", config.LEADERBOARD_SIZE, type=int),
+        config.LEADERBOARD_SIZE,
+    )
+    return flask.jsonify(game.results_store.leaderboard(max(limit, 0)))
+
+
+@app.route("/")
+def serve_root():
+    return flask.redirect("/app")
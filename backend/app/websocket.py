@@ -0,0 +1,130 @@
+import asyncio
+
+from asgiref.typing import ASGIReceiveCallable, ASGISendCallable, WebSocketScope
+
+# Frames read ahead of the game, the same as websockets' own default queue.
+MAX_QUEUE = 32
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class WebSocket:
+    """Thin async wrapper around an ASGI websocket connection.
+
+    Mirrors the parts of simple_websocket's API the game uses: `receive`
+    returns None on timeout and raises ConnectionClosed once the client is
+    gone. Once accepted, frames are read ahead into a queue, so that
+    `receive_batch` can take every binary frame that has already arrived in
+    one call.
+    """
+
+    def __init__(
+        self,
+        scope: WebSocketScope,
+        receive: ASGIReceiveCallable,
+        send: ASGISendCallable,
+    ) -> None:
+        self.scope = scope
+        self._receive = receive
+        self._send = send
+        self.closed = False
+        self.subprotocol: str | None = None
+
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(MAX_QUEUE)
+        self._pending: dict | None = None
+        self._reader: asyncio.Task | None = None
+
+    async def accept(self, subprotocols: tuple[str, ...] = ()) -> None:
+        # Picks the first of `subprotocols` the client offered, if any.
+        message = await self._receive()
+        if message["type"] != "websocket.connect":
+            raise ConnectionClosed()
+        offered = self.scope.get("subprotocols") or []
+        self.subprotocol = next((p for p in subprotocols if p in offered), None)
+        await self._send({"type": "websocket.accept", "subprotocol": self.subprotocol})
+        self._reader = asyncio.create_task(self._read())
+
+    async def receive(self, timeout: int | float | None = None) -> str | bytes | None:
+        message = await self._next(timeout)
+        if message is None:
+            return None
+        return _data(message)
+
+    async def receive_batch(
+        self, timeout: int | float | None = None
+    ) -> str | bytes | None:
+        """Like `receive`, but joins a binary frame with the binary frames
+        queued behind it, up to the next text frame."""
+        message = await self._next(timeout)
+        if message is None:
+            return None
+        data = _data(message)
+        if not isinstance(data, bytes):
+            return data
+        frames = [data]
+        while not self._queue.empty():
+            message = self._queue.get_nowait()
+            data = _data(message)
+            if not isinstance(data, bytes):
+                # Text frames and disconnects are left for the next call.
+                self._pending = message
+                break
+            frames.append(data)
+        return frames[0] if len(frames) == 1 else b"".join(frames)
+
+    async def send(self, data: str | bytes) -> None:
+        if self.closed:
+            raise ConnectionClosed()
+        if isinstance(data, str):
+            message = {"type": "websocket.send", "text": data}
+        else:
+            message = {"type": "websocket.send", "bytes": data}
+        try:
+            await self._send(message)
+        except Exception as e:
+            # Servers raise their own errors when the client has gone away.
+            self.closed = True
+            raise ConnectionClosed() from e
+
+    async def close(self, code: int = 1000) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if not self.closed:
+            self.closed = True
+            try:
+                await self._send({"type": "websocket.close", "code": code})
+            except Exception:
+                pass
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._receive()
+            except Exception:
+                message = {"type": "websocket.disconnect"}
+            await self._queue.put(message)
+            if message["type"] == "websocket.disconnect":
+                return
+
+    async def _next(self, timeout: int | float | None) -> dict | None:
+        if self.closed:
+            raise ConnectionClosed()
+        if self._pending is not None:
+            message, self._pending = self._pending, None
+        else:
+            try:
+                message = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if message["type"] == "websocket.disconnect":
+            self.closed = True
+            raise ConnectionClosed()
+        return message
+
+
+def _data(message: dict) -> str | bytes | None:
+    if message.get("text") is not None:
+        return message["text"]
+    return message.get("bytes")
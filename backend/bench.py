@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import pathlib
+import statistics
+import time
+import wave
+
+import msgpack
+import websockets
+
+COMPACT_PROTOCOL = "gramjam.msgpack"
+
+
+class Clip:
+    def __init__(self, path: pathlib.Path, bytes_per_second: int) -> None:
+        self.path = path
+        self.data = path.read_bytes()
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.bytes_per_second = bytes_per_second
+        if path.suffix == ".wav":
+            with wave.open(str(path)) as f:
+                self.bytes_per_second = (
+                    f.getframerate() * f.getnchannels() * f.getsampwidth()
+                )
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.early = 0
+        self.cards = 0
+        self.sessions = 0
+        self.errors = 0
+        self.rejected = 0
+        self.frames = 0
+        self.peak_rss = 0
+        self.cpu_seconds = 0.0
+
+
+def _card_names() -> dict[str, str]:
+    # Fixtures are named after card classes, and the game only sends prompts,
+    # so map the start of each prompt (before any random parameters) back to
+    # its class.
+    from app import game
+
+    return {c().prompt[:40]: c.__name__ for c in game.Card.__subclasses__()}
+
+
+async def player(url: str, clips: dict[str, Clip], default: Clip, args, stats):
+    names = _card_names() if clips and not args.compact else {}
+    subprotocols = [COMPACT_PROTOCOL] if args.compact else None
+    for _ in range(args.games):
+        async with websockets.connect(
+            url,
+            max_size=None,
+            subprotocols=subprotocols,
+            compression="deflate" if args.deflate else None,
+        ) as ws:
+            sender = None
+            stopped = 0.0
+            async for message in ws:
+                if isinstance(message, bytes):
+                    data = msgpack.unpackb(message) or {}
+                else:
+                    data = json.loads(message) or {}
+                if data.get("type") == "new_card":
+                    if "card" in data:
+                        name = data["card"]
+                    else:
+                        name = names.get(data["message"][:40])
+                    clip = clips.get(name, default)
+                    sender = asyncio.create_task(_send_audio(ws, clip, args, stats))
+                elif data.get("type") in ("success", "failure"):
+                    if sender is None:
+                        # Turned away before the first card, e.g. server busy.
+                        stats.rejected += 1
+                        break
+                    stats.cards += 1
+                    if sender.done():
+                        stopped = sender.result()
+                        stats.latencies.append(time.perf_counter() - stopped)
+                    else:
+                        # Decided while the player was still talking.
+                        stats.early += 1
+                        sender.cancel()
+                elif data.get("type") == "game_over":
+                    stats.sessions += 1
+                    break
+            else:
+                stats.errors += 1
+
+
+async def _send_audio(ws, clip: Clip, args, stats: Stats) -> float:
+    # Replays the clip in frames of --frame-ms, like the browser recorder
+    # does, and returns the time audio_stop was sent.
+    await ws.send(json.dumps({"type": "audio_start", "mimetype": clip.mimetype}))
+    step = max(1, clip.bytes_per_second * args.frame_ms // 1000)
+    for i in range(0, len(clip.data), step):
+        await ws.send(clip.data[i : i + step])
+        stats.frames += 1
+        if args.speed > 0:
+            await asyncio.sleep(args.frame_ms / 1000 / args.speed)
+    await ws.send(json.dumps({"type": "audio_stop"}))
+    return time.perf_counter()
+
+
+async def _guarded(coro, stats: Stats) -> None:
+    try:
+        await coro
+    except (OSError, websockets.WebSocketException) as e:
+        stats.errors += 1
+        print(f"Client error: {e!r}")
+
+
+async def sample_memory(pid: int, stats: Stats) -> None:
+    while True:
+        stats.peak_rss = max(stats.peak_rss, _rss(pid))
+        await asyncio.sleep(0.5)
+
+
+def _rss(pid: int) -> int:
+    # Resident memory of the server and its workers, in bytes.
+    total = 0
+    try:
+        for line in open(f"/proc/{pid}/status"):
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1]) * 1024
+        for task in pathlib.Path(f"/proc/{pid}/task").iterdir():
+            for child in (task / "children").read_text().split():
+                total += _rss(int(child))
+    except OSError:
+        pass
+    return total
+
+
+def _cpu_seconds(pid: int) -> float:
+    # CPU time used by the server and its workers so far.
+    total = 0.0
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+        total += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        for task in pathlib.Path(f"/proc/{pid}/task").iterdir():
+            for child in (task / "children").read_text().split():
+                total += _cpu_seconds(int(child))
+    except OSError:
+        pass
+    return total
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+async def run(args) -> Stats:
+    default = Clip(pathlib.Path(args.audio), args.bytes_per_second)
+    clips = {}
+    if args.fixtures:
+        for path in pathlib.Path(args.fixtures).iterdir():
+            if path.suffix != ".json":
+                clips[path.stem] = Clip(path, args.bytes_per_second)
+
+    stats = Stats()
+    sampler = None
+    if args.server_pid:
+        sampler = asyncio.create_task(sample_memory(args.server_pid, stats))
+        cpu_start = _cpu_seconds(args.server_pid)
+
+    players = []
+    for i in range(args.clients):
+        players.append(
+            asyncio.create_task(
+                _guarded(player(args.url, clips, default, args, stats), stats)
+            )
+        )
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.clients)
+    await asyncio.gather(*players)
+
+    if sampler is not None:
+        sampler.cancel()
+        stats.cpu_seconds = _cpu_seconds(args.server_pid) - cpu_start
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent players against /play. Use together with "
+        "fake_deepgram.py to measure capacity without the real API."
+    )
+    parser.add_argument("audio", help="clip sent for cards without a fixture")
+    parser.add_argument("--url", default="ws://localhost:8080/play")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--games", type=int, default=1, help="games per client")
+    parser.add_argument(
+        "--ramp", type=float, default=0, help="seconds over which clients connect"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="playback speed relative to real time, 0 sends as fast as possible",
+    )
+    parser.add_argument(
+        "--bytes-per-second",
+        type=int,
+        default=4000,
+        help="bitrate used to pace clips that aren't WAV",
+    )
+    parser.add_argument(
+        "--frame-ms", type=int, default=100, help="milliseconds of audio per frame"
+    )
+    parser.add_argument(
+        "--deflate",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="offer permessage-deflate to the server",
+    )
+    parser.add_argument(
+        "--fixtures", help="directory of per-card clips, e.g. CryptoCard.ogg"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="use the msgpack protocol, in which cards are sent by name",
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="sample this process' memory and CPU time"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = asyncio.run(run(args))
+    elapsed = time.perf_counter() - start
+
+    print(f"Sessions:        {stats.sessions} in {elapsed:.1f}s")
+    print(f"Sessions/s:      {stats.sessions / elapsed:.2f}")
+    print(f"Cards:           {stats.cards} ({stats.early} decided early)")
+    print(f"Errors:          {stats.errors}")
+    print(f"Rejected:        {stats.rejected}")
+    print(f"Audio frames/s:  {stats.frames / elapsed:.0f}")
+    print("Verdict latency after audio_stop:")
+    for percent in (50, 95, 99):
+        latency = _percentile(stats.latencies, percent) * 1000
+        print(f"  p{percent}:           {latency:.0f} ms")
+    if args.server_pid:
+        print(f"Peak server RSS: {stats.peak_rss / 1024 / 1024:.1f} MiB")
+        cpu = stats.cpu_seconds / max(stats.sessions, 1) * 1000
+        print(f"Server CPU:      {cpu:.1f} ms per session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import websockets
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import app.asgi
+print(time.perf_counter() - start)
+"""
+
+
+def _env(port: int) -> dict[str, str]:
+    env = dict(os.environ)
+    # No API key needed, and nothing is transcribed anyway.
+    env.setdefault("TRANSCRIPTION_BACKEND", "fixture")
+    env["APP_DEBUG"] = "false"
+    env["APP_PORT"] = str(port)
+    return env
+
+
+def import_time(port: int) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        env=_env(port),
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return float(output)
+
+
+async def _first_connection(url: str, deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        try:
+            async with websockets.connect(url, open_timeout=1):
+                return
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake):
+            await asyncio.sleep(0.005)
+    raise TimeoutError(f"No connection to {url}")
+
+
+def time_to_first_connection(port: int, timeout: float) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app"],
+        env=_env(port),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(_first_connection(f"ws://localhost:{port}/play", start + timeout))
+        return time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure how long the backend takes to import, and to accept "
+        "its first /play connection after the process is started."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    imports = [import_time(args.port) for _ in range(args.runs)]
+    connects = [
+        time_to_first_connection(args.port, args.timeout) for _ in range(args.runs)
+    ]
+
+    print(f"Import app.asgi:      {statistics.median(imports) * 1000:.0f} ms")
+    print(f"First /play accepted: {statistics.median(connects) * 1000:.0f} ms")
+    print(f"(medians of {args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import wave
+
+from aiohttp import web
+
+from app import backends
+
+
+def _words(transcript: str, start: float = 0.0) -> list[dict]:
+    return [
+        {
+            "word": word.lower().strip(".,!?"),
+            "start": start + i * 0.3,
+            "end": start + i * 0.3 + 0.25,
+            "confidence": 0.99,
+            "speaker": 0,
+            "speaker_confidence": 0.99,
+        }
+        for i, word in enumerate(transcript.split())
+    ]
+
+
+def _alternative(transcript: str) -> dict:
+    return {"transcript": transcript, "confidence": 0.99, "words": _words(transcript)}
+
+
+def _response(app: web.Application, audio: bytes) -> dict:
+    # Audio that matches a fixture clip gets that clip's canned response.
+    fixture = app["fixtures"].get(hashlib.sha256(audio).hexdigest())
+    if fixture is not None:
+        return fixture
+    return {
+        "metadata": {"request_id": "fake"},
+        "results": {"channels": [{"alternatives": [_alternative(app["transcript"])]}]},
+    }
+
+
+def _duration(audio: bytes) -> float:
+    try:
+        with wave.open(io.BytesIO(audio)) as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        return 0.0
+
+
+async def _delay(app: web.Application, audio: bytes = b"") -> None:
+    latency = app["latency"] + random.uniform(-app["jitter"], app["jitter"])
+    if app["per_second"] and audio:
+        latency += app["per_second"] * _duration(audio)
+    if latency > 0:
+        await asyncio.sleep(latency / 1000)
+
+
+async def prerecorded(request: web.Request) -> web.Response:
+    app = request.app
+    audio = await request.read()
+    if random.random() < app["slow_rate"]:
+        await asyncio.sleep(app["slow_latency"] / 1000)
+    await _delay(app, audio)
+    if random.random() < app["error_rate"]:
+        status = random.choice([500, 502, 503])
+        return web.json_response({"error": "injected failure"}, status=status)
+    return web.json_response(_response(app, audio))
+
+
+async def live(request: web.Request) -> web.WebSocketResponse:
+    # Mimics the live API: each audio frame reveals one more word as an interim
+    # result, and the empty frame that ends the stream flushes a final result.
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    words = request.app["transcript"].split()
+    audio = bytearray()
+    frames = 0
+    async for msg in ws:
+        if msg.type != web.WSMsgType.BINARY:
+            continue
+        if msg.data:
+            audio.extend(msg.data)
+            frames += 1
+            transcript = " ".join(words[:frames])
+            channel = {"alternatives": [_alternative(transcript)]}
+            is_final = False
+        else:
+            await _delay(request.app)
+            response = _response(request.app, bytes(audio))
+            channel = response["results"]["channels"][0]
+            is_final = True
+        await ws.send_str(
+            json.dumps({"type": "Results", "is_final": is_final, "channel": channel})
+        )
+        if is_final:
+            await ws.send_str(json.dumps({"request_id": "fake", "sha256": ""}))
+            break
+
+    await ws.close()
+    return ws
+
+
+async def listen(request: web.Request) -> web.StreamResponse:
+    if request.headers.get("Upgrade", "").lower() == "websocket":
+        return await live(request)
+    return await prerecorded(request)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Deepgram API. Point DEEPGRAM_API_URL "
+        "at http://localhost:<port>/v1 to use it."
+    )
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--transcript",
+        default="extremely hardcore",
+        help="transcript returned for audio that matches no fixture",
+    )
+    parser.add_argument(
+        "--fixtures",
+        help="directory of clips with canned responses, e.g. CryptoCard.ogg "
+        "and CryptoCard.json",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="mean response latency in ms"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="uniform latency jitter in ms"
+    )
+    parser.add_argument(
+        "--per-second",
+        type=float,
+        default=0,
+        help="extra prerecorded latency in ms per second of WAV audio",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="fraction of prerecorded requests that fail with a 5xx error",
+    )
+    parser.add_argument(
+        "--slow-rate",
+        type=float,
+        default=0,
+        help="fraction of prerecorded requests delayed by --slow-latency",
+    )
+    parser.add_argument(
+        "--slow-latency",
+        type=float,
+        default=5000,
+        help="extra latency of slow requests in ms",
+    )
+    args = parser.parse_args()
+
+    app = web.Application(client_max_size=100 * 1024 * 1024)
+    app["transcript"] = args.transcript
+    app["fixtures"] = backends.load_fixtures(args.fixtures) if args.fixtures else {}
+    app["latency"] = args.latency
+    app["jitter"] = args.jitter
+    app["per_second"] = args.per_second
+    app["error_rate"] = args.error_rate
+    app["slow_rate"] = args.slow_rate
+    app["slow_latency"] = args.slow_latency
+    app.router.add_route("*", "/v1/listen", listen)
+    web.run_app(app, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
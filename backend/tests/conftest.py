@@ -0,0 +1,4 @@
+import os
+
+# Nothing is transcribed for real, and no API key is needed.
+os.environ.setdefault("TRANSCRIPTION_BACKEND", "fixture")
@@ -0,0 +1,21 @@
+import asyncio
+import os
+
+from app import cache
+
+
+def test_put_sweeps_expired_files(tmp_path, monkeypatch):
+    async def run() -> None:
+        now = 1000.0
+        monkeypatch.setattr(cache.time, "time", lambda: now)
+        store = cache.TranscriptionCache(size=0, ttl=60, directory=str(tmp_path))
+        await store.put("old", {"n": 1})
+        os.utime(tmp_path / "old.json", (now, now))
+
+        now += cache.TranscriptionCache.SWEEP_INTERVAL
+        await store.put("new", {"n": 2})
+        os.utime(tmp_path / "new.json", (now, now))
+        assert not (tmp_path / "old.json").exists()
+        assert await store.get("new") == {"n": 2}
+
+    asyncio.run(run())
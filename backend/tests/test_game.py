@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import json
+import time
+
+from app import asgi
+from app import backends
+from app import game
+from app import scheduler
+from app import transcription
+from app import websocket
+
+
+class HangingBackend(backends.Backend):
+    """Streams into a socket that never answers."""
+
+    name = "hanging"
+    streaming = True
+
+    def __init__(self) -> None:
+        self.connected = asyncio.Event()
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        raise NotImplementedError()
+
+    @contextlib.asynccontextmanager
+    async def connect(self, options: dict):
+        self.connected.set()
+        yield HangingSocket()
+
+
+class HangingSocket:
+    async def send_bytes(self, data: bytes) -> None:
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.Event().wait()
+
+
+def test_disconnect_during_streaming_card_releases_slot(monkeypatch):
+    async def run() -> None:
+        backend = HangingBackend()
+        slots = scheduler.Scheduler(concurrency=2, queue_size=1)
+        monkeypatch.setattr(
+            game,
+            "transcription_client",
+            transcription.TranscriptionClient(backend=backend, scheduler=slots),
+        )
+        monkeypatch.setitem(
+            game.config.TRANSCRIPTION_MODES, "TwitterHardcoreCard", "streaming"
+        )
+        monkeypatch.setattr(game.registry, "deck", lambda: ["TwitterHardcoreCard"])
+
+        messages = [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": json.dumps({"type": "audio_start"})},
+            {"type": "websocket.receive", "bytes": b"\0" * 640},
+        ]
+
+        async def receive() -> dict:
+            if messages:
+                return messages.pop(0)
+            # The player leaves once the stream holds its slot.
+            await backend.connected.wait()
+            await asyncio.sleep(0)
+            return {"type": "websocket.disconnect"}
+
+        async def send(message: dict) -> None:
+            pass
+
+        scope = {"type": "websocket", "path": "/play", "subprotocols": []}
+        await asgi.play(websocket.WebSocket(scope, receive, send))
+        await asyncio.sleep(0)
+
+        assert backend.connected.is_set()
+        assert slots.running == 0
+        assert slots.waiting == 0
+
+    asyncio.run(run())
+
+
+class SlowBackend(backends.Backend):
+    name = "slow"
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        await asyncio.sleep(10)
+        return {"metadata": {}, "results": {"channels": []}}
+
+
+def test_card_fails_at_its_deadline(monkeypatch):
+    async def run() -> None:
+        monkeypatch.setattr(
+            game,
+            "transcription_client",
+            transcription.TranscriptionClient(
+                backend=SlowBackend(),
+                scheduler=scheduler.Scheduler(concurrency=1, queue_size=1),
+            ),
+        )
+        monkeypatch.setitem(
+            game.config.TRANSCRIPTION_DEADLINES, "TwitterHardcoreCard", 0.05
+        )
+        monkeypatch.setattr(game.registry, "deck", lambda: ["TwitterHardcoreCard"])
+        monkeypatch.setattr(game.results_store, "record", lambda **kwargs: None)
+
+        messages = [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": json.dumps({"type": "audio_start"})},
+            {"type": "websocket.receive", "bytes": b"\0" * 640},
+            {"type": "websocket.receive", "text": json.dumps({"type": "audio_stop"})},
+        ]
+        sent = []
+
+        async def receive() -> dict:
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()
+
+        async def send(message: dict) -> None:
+            if message["type"] == "websocket.send":
+                sent.append(json.loads(message["text"]))
+
+        scope = {"type": "websocket", "path": "/play", "subprotocols": []}
+        start = time.perf_counter()
+        await asgi.play(websocket.WebSocket(scope, receive, send))
+
+        assert time.perf_counter() - start < 1
+        assert game.DEFAULT_ERROR in sent
+        assert sent[-1] == {"type": "game_over", "score": 0}
+
+    asyncio.run(run())
@@ -0,0 +1,199 @@
+import pytest
+
+from app import game
+from app import rules
+
+
+def _alternative(transcript: str, **analysis) -> dict:
+    words = [{"word": word} for word in transcript.split()]
+    return {"transcript": transcript, "words": words, **analysis}
+
+
+def _segments(*sentiments: tuple[str, float]) -> list[dict]:
+    return [{"sentiment": s, "confidence": c} for s, c in sentiments]
+
+
+def _topics(*names: str) -> list[dict]:
+    return [{"topics": [{"topic": name} for name in names]}]
+
+
+def _speakers(*speakers: tuple[int, float]) -> list[dict]:
+    return [
+        {"word": "hi", "speaker": speaker, "speaker_confidence": confidence}
+        for speaker, confidence in speakers
+    ]
+
+
+CASES = [
+    # (card, state, alternative, index of the expected verdict)
+    (
+        "PurchaseTwitterCard",
+        {},
+        _alternative("no", sentiment_segments=_segments(("negative", 0.9))),
+        0,
+    ),
+    (
+        "PurchaseTwitterCard",
+        {},
+        _alternative("yes", sentiment_segments=_segments(("positive", 0.9))),
+        1,
+    ),
+    ("CryptoCard", {}, _alternative("", topics=_topics("finance", "banking")), 0),
+    ("CryptoCard", {}, _alternative("", topics=_topics("finance", "sports")), 1),
+    ("HelloInForeignLanguageCard", {"language": "Mandarin"}, _alternative("你好"), 0),
+    ("HelloInForeignLanguageCard", {"language": "Spanish"}, _alternative("Hola"), 0),
+    ("HelloInForeignLanguageCard", {"language": "French"}, _alternative("hello"), 1),
+    (
+        "SpeedTalkingCard",
+        {"twister": "she sells seashells by the seashore"},
+        _alternative("she sells seashells"),
+        0,
+    ),
+    (
+        "SpeedTalkingCard",
+        {"twister": "she sells seashells by the seashore"},
+        _alternative("she she she she"),
+        1,
+    ),
+    (
+        "YouTubeContentCreatorCard",
+        {},
+        _alternative("like like and subscribe hit the bell"),
+        0,
+    ),
+    ("YouTubeContentCreatorCard", {}, _alternative("like and subscribe hit it"), 1),
+    ("TwitterHardcoreCard", {}, _alternative("I will be extremely hardcore"), 0),
+    ("TwitterHardcoreCard", {}, _alternative("hardcore extremely"), 1),
+    ("TwitterMoneyCard", {}, _alternative(""), 0),
+    (
+        "TwitterMoneyCard",
+        {},
+        _alternative("elon musk", entities=[{"value": "elon"}, {"value": "musk"}]),
+        1,
+    ),
+    ("TwitterMoneyCard", {}, _alternative("elon", entities=[{"value": "elon"}]), 2),
+    ("TwitterMoneyCard", {}, _alternative("someone"), 3),
+    (
+        "OverbookedFlightCard",
+        {},
+        _alternative(
+            "enjoy the travel", sentiment_segments=_segments(("positive", 0.8))
+        ),
+        0,
+    ),
+    (
+        "OverbookedFlightCard",
+        {},
+        _alternative("enjoy", sentiment_segments=_segments(("positive", 0.8))),
+        1,
+    ),
+    (
+        "OverbookedFlightCard",
+        {},
+        _alternative(
+            "air travel is awful",
+            sentiment_segments=_segments(("negative", 0.8), ("positive", 0.1)),
+        ),
+        2,
+    ),
+    (
+        "OverbookedFlightCard",
+        {},
+        _alternative("awful", sentiment_segments=_segments(("negative", 0.8))),
+        3,
+    ),
+    ("PoliticalLettuceCard", {}, _alternative("more than a lettuce"), 0),
+    ("PoliticalLettuceCard", {}, _alternative("my career"), 1),
+    ("CatfishCard", {}, _alternative("finding love"), 0),
+    ("CatfishCard", {}, _alternative("finding nemo"), 1),
+    ("OscarSlapCard", {}, {"transcript": "hi", "words": _speakers((1, 1), (1, 1))}, 0),
+    ("OscarSlapCard", {}, {"transcript": "hi", "words": _speakers((0, 0.8))}, 1),
+    ("OscarSlapCard", {}, {"transcript": "hi", "words": _speakers((0, 0.95))}, 2),
+    ("OscarSlapCard", {}, {"transcript": "hi", "words": _speakers((0, 1))}, 3),
+]
+
+
+@pytest.mark.parametrize("name, state, alternative, index", CASES)
+def test_verdict(name, state, alternative, index):
+    card = game.registry.deal(name, state)
+    expected = card.validator.verdicts[index]
+    # Messages referring to matches are only about TwitterMoneyCard's entities.
+    entities = [e["value"] for e in alternative.get("entities", [])]
+    message = expected.message.format(
+        match=entities[0] if entities else "", matches=", ".join(entities)
+    )
+    assert card.validator.verdict(alternative) == {
+        "type": expected.type,
+        "message": message,
+    }
+
+
+@pytest.mark.parametrize(
+    "count, message",
+    [
+        (10, "You're a walking dictionary!"),
+        (6, "So close! You got: B0, B1, B2, B3, B4, B5"),
+        (1, "Nice try! You got: B0"),
+        (0, "Uh oh! Your vocab might need a little work."),
+    ],
+)
+def test_trapped_family_lists_matches(count, message):
+    card = game.registry.deal("TrappedFamilyCard", {"letter": "B"})
+    # Repeated words only count once.
+    words = " ".join(f"b{i} b{i}" for i in range(count))
+    verdict = card.validator.verdict(_alternative(words + " apple"))
+    assert verdict["message"] == message
+
+
+def test_empty_response_is_an_error():
+    card = game.registry.deal("CatfishCard", {})
+    response = {"results": {"channels": []}}
+    assert card.validate_response(response) == game.DEFAULT_ERROR
+
+
+def test_decided_once_a_monotonic_success_holds():
+    card = game.registry.deal("TwitterHardcoreCard", {})
+    assert not card.is_decided(["i", "am", "extremely"])
+    assert card.is_decided(["i", "am", "extremely", "hardcore", "not"])
+
+    card = game.registry.deal("TrappedFamilyCard", {"letter": "C"})
+    words = [f"c{i}" for i in range(9)]
+    assert not card.is_decided(words + ["c0"])
+    assert card.is_decided(words + ["c9"])
+
+
+def test_never_decided_on_analysis_or_failure():
+    # Topics can't be known before the end, and OscarSlapCard's first verdict
+    # needs speakers.
+    assert not game.registry.deal("CryptoCard", {}).is_decided(["finance"] * 50)
+    assert not game.registry.deal("OscarSlapCard", {}).is_decided(["hi"])
+
+
+def test_options_turn_on_exactly_the_features_read():
+    assert game.registry.deal("PurchaseTwitterCard", {}).options == {
+        "sent_thresh": 0.0,
+        "analyze_sentiment": True,
+    }
+    assert game.registry.deal("CryptoCard", {}).options == {"detect_topics": True}
+    assert game.registry.deal("OscarSlapCard", {}).options == {"diarize": True}
+
+    validator = rules.Validator(
+        (rules.success("", when=rules.Phrase("hi")), rules.failure(""))
+    )
+    options = {
+        "punctuate": False,
+        "analyze_sentiment": True,
+        "sent_thresh": 0.2,
+        "detect_topics": True,
+    }
+    assert validator.options("Card", options) == {"punctuate": False}
+
+
+def test_cards_reading_analysis_features_are_not_streamed(monkeypatch):
+    monkeypatch.setitem(game.config.TRANSCRIPTION_MODES, "CryptoCard", "streaming")
+    monkeypatch.setattr(game.transcription_client.backend, "streaming", True)
+    monkeypatch.setitem(
+        game.config.TRANSCRIPTION_MODES, "TwitterHardcoreCard", "streaming"
+    )
+    assert game.registry.deal("CryptoCard", {}).mode == "chunked"
+    assert game.registry.deal("TwitterHardcoreCard", {}).mode == "streaming"
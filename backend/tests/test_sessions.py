@@ -0,0 +1,26 @@
+import asyncio
+
+from app import sessions
+
+
+def test_memory_store_drops_expired_sessions(monkeypatch):
+    async def run() -> None:
+        now = 1000.0
+        monkeypatch.setattr(sessions.time, "time", lambda: now)
+        store = sessions.MemorySessionStore(ttl=10)
+        first = sessions.Session.new([{"card": "CryptoCard"}])
+        second = sessions.Session.new([{"card": "CryptoCard"}])
+        await store.put(first)
+        now += 5
+        await store.put(second)
+        now += 4
+        # Putting the first session again keeps it alive for another ttl.
+        await store.put(first)
+        now += 7
+
+        await store.put(sessions.Session.new([{"card": "CryptoCard"}]))
+        assert await store.get(first.token) is not None
+        assert await store.get(second.token) is None
+        assert second.token not in store._sessions
+
+    asyncio.run(run())
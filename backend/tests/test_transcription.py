@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app import backends
+from app import scheduler
+from app import transcription
+
+RESPONSE = {"metadata": {}, "results": {"channels": []}}
+
+
+class ScriptedBackend(backends.Backend):
+    """Answers each request with the next step of a script: a number of
+    seconds to wait, then a response or a TranscriptionError to raise."""
+
+    name = "scripted"
+
+    def __init__(self, *steps: tuple[float, dict | Exception]) -> None:
+        self.steps = list(steps)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def transcribe(self, source: dict, options: dict) -> dict:
+        delay, result = self.steps[self.calls]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _transient() -> transcription.TranscriptionError:
+    return transcription.TranscriptionError("DG: 503", transient=True)
+
+
+def _prerecorded(client: transcription.TranscriptionClient) -> dict:
+    source = {"buffer": b"audio", "mimetype": "audio/wav"}
+    return asyncio.run(client.prerecorded(source, {}))
+
+
+def test_transient_errors_are_retried():
+    backend = ScriptedBackend((0, _transient()), (0, _transient()), (0, RESPONSE))
+    client = transcription.TranscriptionClient(
+        backend=backend, retries=2, backoff=0.001
+    )
+    assert _prerecorded(client) == RESPONSE
+    assert backend.calls == 3
+
+
+def test_retries_give_up():
+    backend = ScriptedBackend((0, _transient()), (0, _transient()), (0, RESPONSE))
+    client = transcription.TranscriptionClient(
+        backend=backend, retries=1, backoff=0.001
+    )
+    with pytest.raises(transcription.TranscriptionError):
+        _prerecorded(client)
+    assert backend.calls == 2
+
+
+def test_permanent_errors_are_not_retried():
+    error = transcription.TranscriptionError("DG: 400", transient=False)
+    backend = ScriptedBackend((0, error), (0, RESPONSE))
+    client = transcription.TranscriptionClient(
+        backend=backend, retries=2, backoff=0.001
+    )
+    with pytest.raises(transcription.TranscriptionError):
+        _prerecorded(client)
+    assert backend.calls == 1
+
+
+def test_slow_request_is_hedged():
+    hedged = {"metadata": {"request_id": "hedge"}, "results": {"channels": []}}
+    backend = ScriptedBackend((10, RESPONSE), (0, hedged))
+    client = transcription.TranscriptionClient(backend=backend, hedge_after=0.01)
+    assert _prerecorded(client) == hedged
+    assert backend.calls == 2
+    # The slow request is dropped once the hedge has answered.
+    assert backend.cancelled == 1
+
+
+def test_hedge_failure_waits_for_first_request():
+    backend = ScriptedBackend((0.05, RESPONSE), (0, _transient()))
+    client = transcription.TranscriptionClient(backend=backend, hedge_after=0.01)
+    assert _prerecorded(client) == RESPONSE
+
+
+def test_no_hedge_without_a_free_slot():
+    backend = ScriptedBackend((0.05, RESPONSE), (0, RESPONSE))
+    client = transcription.TranscriptionClient(
+        backend=backend,
+        hedge_after=0.01,
+        scheduler=scheduler.Scheduler(concurrency=1, queue_size=1),
+    )
+    assert _prerecorded(client) == RESPONSE
+    assert backend.calls == 1
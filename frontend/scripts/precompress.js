@@ -0,0 +1,44 @@
+// Writes .br and .gz copies of the compressible files in build/, which the
+// backend serves to browsers that accept them.
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const BUILD_DIR = path.join(__dirname, '..', 'build');
+const COMPRESSIBLE = /\.(css|html|js|json|map|svg|txt|wasm)$/;
+const MIN_SIZE = 1024;
+
+function* walk(dir) {
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const file = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      yield* walk(file);
+    } else {
+      yield file;
+    }
+  }
+}
+
+for (const file of walk(BUILD_DIR)) {
+  if (!COMPRESSIBLE.test(file)) {
+    continue;
+  }
+  const data = fs.readFileSync(file);
+  if (data.length < MIN_SIZE) {
+    continue;
+  }
+  const br = zlib.brotliCompressSync(data, {
+    params: {
+      [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+      [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  });
+  const gz = zlib.gzipSync(data, { level: zlib.constants.Z_BEST_COMPRESSION });
+  // Only keep variants that are actually smaller.
+  if (br.length < data.length) {
+    fs.writeFileSync(`${file}.br`, br);
+  }
+  if (gz.length < data.length) {
+    fs.writeFileSync(`${file}.gz`, gz);
+  }
+}
@@ -22,10 +22,13 @@ const reducer = (state, action) => {
     }
 
     case 'FAILED_CARD': {
+      // The server can refuse a game (e.g. when busy) before dealing a card,
+      // show that on the first card.
+      const failedIndex = Math.max(state.currentCardIndex, 0);
       return {
         ...state,
         events: state.events.map((event, index) => {
-          if (state.currentCardIndex === index) {
+          if (failedIndex === index) {
             return { ...event, completed: false, failMessage: action.message };
           } else {
             return event;
@@ -51,6 +54,17 @@ const reducer = (state, action) => {
       };
     }
 
+    case 'RESUME': {
+      // The cards before the resumed one were all won.
+      return {
+        ...state,
+        currentCardIndex: action.index - 1,
+        events: state.events.map((event, index) =>
+          index < action.index ? { ...event, completed: true } : event
+        ),
+      };
+    }
+
     case 'GAME_OVER':
       return {
         ...state,
@@ -63,6 +77,7 @@ const reducer = (state, action) => {
 };
 
 const WEBSOCKET_URL = 'ws://localhost:8080/play';
+const SESSION_KEY = 'playSession';
 
 export default memo(function GameBoard() {
   const [state, dispatch] = useReducer(reducer, {
@@ -77,6 +92,13 @@ export default memo(function GameBoard() {
       console.log('/play onMessage', data);
 
       switch (data.type) {
+        case 'session':
+          sessionStorage.setItem(SESSION_KEY, data.token);
+          if (data.index !== undefined) {
+            dispatch({ type: 'RESUME', index: data.index });
+          }
+          break;
+
         case 'new_card':
           dispatch({
             type: 'ADD_CARD',
@@ -94,6 +116,7 @@ export default memo(function GameBoard() {
           break;
 
         case 'game_over':
+          sessionStorage.removeItem(SESSION_KEY);
           dispatch({ type: 'GAME_OVER', score: data.score });
           break;
       }
@@ -109,7 +132,13 @@ export default memo(function GameBoard() {
     readyState,
     getWebSocket,
   } = useWebSocket(WEBSOCKET_URL, {
-    onOpen: () => console.log('/play socket opened'),
+    onOpen: () => {
+      console.log('/play socket opened');
+      const token = sessionStorage.getItem(SESSION_KEY);
+      if (token) {
+        sendJsonMessage({ type: 'resume', token });
+      }
+    },
     onClose: () => console.log('/play socket closed'),
     onMessage,
   });